@@ -1,34 +1,165 @@
+import os
 import re
+import sqlite3
+import threading
 import unicodedata
 
+from functools import lru_cache
+
 
 
 ###CONSTANTS###
 AUDIO_EXTENSIONS = ['.mp3', '.flac', '.wav', '.m4a', '.aac', '.ogg', '.wma', '.opus']
+DATA_DIRECTORY   = os.environ.get('YOUTUBE_MP3_DATA', os.path.join(os.path.expanduser('~'), '.youtube_mp3'))
+
+# Precompiled patterns of convert_name
+APOSTROPHES             = str.maketrans('', '', "'\u2019\u2018`´")
+PATTERN_SPECIAL_CHARS   = re.compile(r'[^0-9a-zA-Z-]+')
+PATTERN_CONTRACTIONS    = re.compile(r'\b(\w+)\s([st])\b')
+PATTERN_HTML_39         = re.compile(r'\s39s\b', flags=re.IGNORECASE)
+PATTERN_SPACES          = re.compile(r'\s+')
+
+# Maximum number of names kept by the convert_name cache
+CONVERT_NAME_CACHE_SIZE = 65536
+
+# Working directories main.py keeps inside the download directory (scratch and resumable downloads)
+DIRECTORY_TEMP_PREFIX   = '.temp_'
+DIRECTORY_PARTIAL       = '.partial'
 
 
 
 ###METHOD###
+@lru_cache(maxsize=CONVERT_NAME_CACHE_SIZE)
 def convert_name(name_to_convert: str) -> str:
     # Normalize unicode first
     name = unicodedata.normalize('NFKD', name_to_convert)
 
     # Remove all types of apostrophes (before encoding to ASCII)
-    name = re.sub(r"[''\u0027\u2019\u2018`´'']", '', name)
+    name = name.translate(APOSTROPHES)
 
     # Encode to ASCII and convert to lowercase
     name = name.encode('ASCII', 'ignore').decode('utf-8').lower()
 
-    # Replace special characters with spaces
-    name = re.sub(r'[^0-9a-zA-Z-]+', ' ', name)
+    # Replace special characters with spaces (only single spaces are left as separators)
+    name = PATTERN_SPECIAL_CHARS.sub(' ', name)
 
     # No space for contraction (ex: it s -> its, don t -> dont)
-    name = re.sub(r'\b(\w+)\s([st])\b', r'\1\2', name)
+    if ' s' in name or ' t' in name:
+        name = PATTERN_CONTRACTIONS.sub(r'\1\2', name)
 
     # Fix files that already had the 39S encoding error
-    name = re.sub(r'\s39s\b', 's', name, flags=re.IGNORECASE)
+    if '39s' in name:
+        name = PATTERN_HTML_39.sub('s', name)
 
     # Remove bad space and set Title Case for all words
-    name = re.sub(r'\s+', ' ', name).strip().title()
+    if '  ' in name:
+        name = PATTERN_SPACES.sub(' ', name)
+
+    name = name.strip().title()
 
     return name
+
+
+
+def convert_names(names_to_convert) -> list:
+    # Batch version of convert_name (a whole directory at once), duplicates are converted only once
+    return [convert_name(name) for name in names_to_convert]
+
+
+
+def is_working_directory(name: str) -> bool:
+    # Scratch and partial download directories are not part of the library, tools must not walk them
+    return name.startswith(DIRECTORY_TEMP_PREFIX) or name == DIRECTORY_PARTIAL
+
+
+
+def walk_library(target_path: str):
+    """os.walk of a library tree, the working directories of main.py are not entered"""
+    for directory, subdirectories, files in os.walk(target_path):
+        subdirectories[:] = [item for item in subdirectories if not is_working_directory(item)]
+
+        yield directory, subdirectories, files
+
+
+
+def open_database(name: str, schema: str) -> sqlite3.Connection:
+    # Databases (archive, caches, indexes) live in the data directory
+    os.makedirs(DATA_DIRECTORY, exist_ok=True)
+
+    # Shared by worker threads, callers serialize access with their own lock
+    connection = sqlite3.connect(os.path.join(DATA_DIRECTORY, name), timeout=30, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(schema)
+
+    return connection
+
+
+
+class PathIndex:
+    """Rows of one table keyed by path, for the caches and indexes of the tools (one database per subclass)"""
+
+    SCHEMA  = None
+    TABLE   = None
+
+    def __init__(self, name: str):
+        self.connection = open_database(name, self.SCHEMA)
+        self.lock       = threading.Lock()
+        self.updates    = {}
+        self.visited    = set()
+
+        # Loaded once: a lookup per path must not cost a query
+        self.records = {row[0]: self.load_record(row[1:]) for row in self.connection.execute(f'SELECT * FROM {self.TABLE}')}
+
+    def load_record(self, values: tuple):
+        # Columns after the path, as kept in memory
+        return values
+
+    def dump_record(self, record) -> tuple:
+        # Columns after the path, as written in the table
+        return record
+
+    def lookup(self, path: str):
+        with self.lock:
+            self.visited.add(path)
+
+            return self.updates.get(path) or self.records.get(path)
+
+    def update(self, path: str, record) -> None:
+        # Written by save(), in one transaction
+        with self.lock:
+            self.visited.add(path)
+            self.updates[path] = record
+
+    def forget(self, path: str) -> None:
+        with self.lock:
+            self.visited.discard(path)
+            self.updates.pop(path, None)
+
+    def save(self, target_path: str = None, recursive: bool = True) -> None:
+        """Write the updates in one transaction, forget the paths of the scanned tree not seen anymore"""
+        # No target_path (interrupted scan): nothing is forgotten, unseen paths were maybe just not reached.
+        # Not recursive: only the direct children of target_path were scanned.
+        prefix  = os.path.join(target_path, '') if target_path else None
+        removed = [
+            path for path in self.records
+            if prefix and path not in self.visited
+            and ((path == target_path or path.startswith(prefix)) if recursive else os.path.dirname(path) == target_path)
+        ]
+
+        with self.lock, self.connection:
+            rows = [(path,) + tuple(self.dump_record(record)) for path, record in self.updates.items()]
+
+            self.connection.executemany(f'DELETE FROM {self.TABLE} WHERE path = ?', [(path,) for path in removed])
+
+            if rows:
+                self.connection.executemany(f"INSERT OR REPLACE INTO {self.TABLE} VALUES ({', '.join('?' * len(rows[0]))})", rows)
+
+            for path in removed:
+                del self.records[path]
+
+            self.records.update(self.updates)
+            self.updates = {}
+
+    def close(self) -> None:
+        self.connection.close()
+
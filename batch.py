@@ -0,0 +1,200 @@
+import os
+import sys
+import signal
+import asyncio
+import argparse
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from main import (
+    DownloadContext, OUTPUT_FORMATS,
+    check_ytdlp_version, encode_audio, extract_playlist, fetch_audio, get_entry_id, is_youtube_url
+)
+
+
+
+###METHOD###
+def read_urls(stream, loop: asyncio.AbstractEventLoop, urls: asyncio.Queue) -> None:
+    # Skip blank lines and comments, None marks the end of the stream
+    for line in stream:
+        url = line.strip()
+
+        if url and not url.startswith('#'):
+            loop.call_soon_threadsafe(urls.put_nowait, url)
+
+    loop.call_soon_threadsafe(urls.put_nowait, None)
+
+
+
+async def run_batch(stream, context: DownloadContext, resolve_jobs: int = 4, jobs: int = 4, encode_jobs: int = None) -> dict:
+    """Download every URL of the stream (videos and playlists), return the number of tracks per status"""
+    loop        = asyncio.get_running_loop()
+    encode_jobs = encode_jobs or os.cpu_count() or 1
+    results     = {'succeeded': 0, 'failed': 0, 'cancelled': 0}
+    stopping    = asyncio.Event()
+
+    # One executor per stage, each one bounds the concurrency of its stage
+    resolve_executor    = ThreadPoolExecutor(max_workers=resolve_jobs)
+    fetch_executor      = ThreadPoolExecutor(max_workers=jobs)
+    encode_executor     = ThreadPoolExecutor(max_workers=encode_jobs)
+
+    # Bound the tracks in flight, so huge playlists do not queue thousands of futures
+    tracks_semaphore = asyncio.Semaphore(jobs + encode_jobs * 2)
+
+    def stop() -> None:
+        # First Ctrl+C: finish the running tracks, start nothing new. Second one: abort.
+        print("\n⏹️  Stopping after the running downloads (Ctrl+C again to abort)...")
+        stopping.set()
+        loop.remove_signal_handler(signal.SIGINT)
+
+    try:
+        loop.add_signal_handler(signal.SIGINT, stop)
+    except NotImplementedError:
+        pass
+
+    async def process_track(entry: dict, playlist_title: str) -> None:
+        async with tracks_semaphore:
+            if stopping.is_set():
+                results['cancelled'] += 1
+                return
+
+            try:
+                job = await loop.run_in_executor(fetch_executor, fetch_audio, entry['url'], playlist_title, entry.get('title'), context)
+
+                if isinstance(job, dict):
+                    job = await loop.run_in_executor(encode_executor, encode_audio, job, context)
+
+            except Exception as error:
+                print(f"❌ Unexpected error for {entry['url']}: {str(error)}")
+                job = False
+
+        # Failed tracks go to the retry queue (python main.py --retry-failed)
+        if job:
+            results['succeeded'] += 1
+            context.retry_queue.remove([get_entry_id(entry)])
+        else:
+            results['failed'] += 1
+            context.retry_queue.add(get_entry_id(entry), entry, playlist_title)
+
+    async def process_url(url: str) -> None:
+        if not is_youtube_url(url):
+            print(f"❌ Invalid YouTube URL, skipping: {url}")
+            results['failed'] += 1
+            return
+
+        # Standalone video
+        if "playlist" not in url:
+            await process_track({'url': url}, None)
+            return
+
+        # Playlist, resolved on the resolve executor
+        try:
+            playlist_dict, playlist_title = await loop.run_in_executor(resolve_executor, extract_playlist, url)
+        except Exception as error:
+            print(f"❌ Could not resolve playlist {url}: {str(error)}")
+            results['failed'] += 1
+            return
+
+        entries = [entry for entry in playlist_dict['entries'] if entry]
+        print(f"🎶 Playlist {playlist_title}: {len(entries)} video(s)")
+
+        await asyncio.gather(*(process_track(entry, playlist_title) for entry in entries))
+
+    # URLs are read by a daemon thread while earlier ones are processed (works with an endless stdin queue)
+    urls    = asyncio.Queue()
+    reader  = threading.Thread(target=read_urls, args=(stream, loop, urls), daemon=True)
+    reader.start()
+
+    tasks       = []
+    stop_wait   = asyncio.ensure_future(stopping.wait())
+    aborted     = True
+
+    try:
+        while True:
+            url_wait = asyncio.ensure_future(urls.get())
+            await asyncio.wait([url_wait, stop_wait], return_when=asyncio.FIRST_COMPLETED)
+
+            if not url_wait.done():
+                url_wait.cancel()
+                break
+
+            url = url_wait.result()
+
+            if url is None:
+                break
+
+            tasks.append(asyncio.ensure_future(process_url(url)))
+
+        await asyncio.gather(*tasks)
+        aborted = False
+
+    finally:
+        stop_wait.cancel()
+
+        # Only a graceful end waits for the workers, an abort drops the queued tracks (DownloadContext.close() removes the scratch files)
+        for executor in [resolve_executor, fetch_executor, encode_executor]:
+            executor.shutdown(wait=not aborted, cancel_futures=aborted)
+
+    return results
+
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Download a batch of YouTube videos and playlists (one URL per line)")
+    parser.add_argument('source', nargs='?', default='-', help="File with one URL per line, '-' for stdin (default: -)")
+    parser.add_argument('--resolve-jobs', type=int, default=4, help="Number of playlists resolved in parallel (default: 4)")
+    parser.add_argument('-j', '--jobs', type=int, default=4, help="Number of downloads running in parallel (default: 4)")
+    parser.add_argument('--encode-jobs', type=int, default=None, help="Number of parallel MP3 encodes (default: number of CPU cores)")
+    parser.add_argument('--format', dest='audio_format', choices=sorted(OUTPUT_FORMATS), default='mp3', help="Output policy, see main.py --help (default: mp3)")
+    parser.add_argument('--max-rate', type=float, default=5.0, help="Maximum YouTube requests per second (default: 5)")
+    parser.add_argument('--no-update-check', action='store_true', help="Do not check for yt-dlp updates (or set YOUTUBE_MP3_NO_UPDATE=1)")
+    parser.add_argument('--no-archive', action='store_true', help="Ignore the download archive (skip only on existing files)")
+
+    arguments = parser.parse_args()
+
+    for name in ['resolve_jobs', 'jobs', 'encode_jobs']:
+        value = getattr(arguments, name)
+
+        if value is not None and value < 1:
+            parser.error(f"--{name.replace('_', '-')} must be at least 1")
+
+    if arguments.max_rate <= 0:
+        parser.error("--max-rate must be positive")
+
+    return arguments
+
+
+
+###MAIN###
+if __name__ == "__main__":
+    arguments = parse_arguments()
+
+    # Check yt-dlp updates (Youtube compatibility or restrictions)
+    if not arguments.no_update_check:
+        check_ytdlp_version()
+
+    if arguments.source == '-':
+        stream = sys.stdin
+        print("📥 Reading URLs from stdin")
+    else:
+        stream = open(os.path.expanduser(arguments.source), encoding='utf-8')
+        print(f"📄 Reading URLs from: {arguments.source}")
+
+    # Temporary files are removed when the context is closed, final files are only created by os.replace
+    try:
+        with DownloadContext(not arguments.no_archive, arguments.audio_format, arguments.max_rate) as context:
+            results = asyncio.run(run_batch(stream, context, arguments.resolve_jobs, arguments.jobs, arguments.encode_jobs))
+
+    except KeyboardInterrupt:
+        print("\n🛑 Aborted!", flush=True)
+        # The context is already closed, skip the interpreter exit which would join the still running workers
+        os._exit(130)
+
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    print(f"\n📋 Batch summary: {results['succeeded']} succeeded, {results['failed']} failed, {results['cancelled']} cancelled")
+    print("✅ Batch task terminated!")
+    sys.exit(1 if results['failed'] or results['cancelled'] else 0)
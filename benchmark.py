@@ -0,0 +1,410 @@
+import os
+import re
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import unicodedata
+
+from collections import Counter
+
+from Tool   import convert_name, convert_names, AUDIO_EXTENSIONS
+from folder import detect_common_patterns, rename_items_in_directory, RenameJournal
+
+
+
+###CONSTANTS###
+REPOSITORY_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Modules and CLI calls measured by the import benchmark
+IMPORT_MODULES  = ['Tool', 'folder', 'rename', 'tag', 'main', 'batch', 'cli']
+STARTUP_CALLS   = [
+    ['cli.py', '--help'],
+    ['cli.py', 'download', '--help'],
+    ['main.py', '--help'],
+    ['batch.py', '--help'],
+]
+
+# Words used to build file name corpora (accents, apostrophes, 39 artifacts, separators...)
+CORPUS_WORDS = [
+    'Beyoncé', 'Mötley', 'Crüe', "Don't", 'L’amour', 'It‘s', 'Rock`n', 'Café', 'Señor', 'Live',
+    'Remix', 'feat.', 'Official', 'Video', '(Audio)', '[HD]', '39s', '&#39;', 'Aespa', 'Naïve',
+    'Über', 'Ça', 'Déjà', 'vu', 'Night', 'Love', '2024', '01', '-', '_', '|', 'Ø', 'Æther', 'Hello',
+]
+
+# Directory sizes of the pattern detection benchmark, the reference only runs up to REFERENCE_MAX_SIZE
+PATTERN_SIZES       = [1000, 2000, 4000, 8000, 16000, 32000]
+REFERENCE_MAX_SIZE  = 4000
+
+# File system calls counted by the syscall benchmark
+COUNTED_SYSCALLS = ['stat', 'lstat', 'listdir', 'scandir', 'rename']
+
+
+
+###METHOD###
+def convert_name_reference(name_to_convert: str) -> str:
+    """convert_name before precompilation and caching, the output must stay identical"""
+    name = unicodedata.normalize('NFKD', name_to_convert)
+    name = re.sub(r"[''\u0027\u2019\u2018`´'']", '', name)
+    name = name.encode('ASCII', 'ignore').decode('utf-8').lower()
+    name = re.sub(r'[^0-9a-zA-Z-]+', ' ', name)
+    name = re.sub(r'\b(\w+)\s([st])\b', r'\1\2', name)
+    name = re.sub(r'\s39s\b', 's', name, flags=re.IGNORECASE)
+    name = re.sub(r'\s+', ' ', name).strip().title()
+
+    return name
+
+
+
+def detect_common_patterns_reference(filenames: list) -> list:
+    """detect_common_patterns before the sorted-name lookups, the output must stay identical"""
+    names = []
+    for item in filenames:
+        name, ext = os.path.splitext(item)
+        if ext.lower() in AUDIO_EXTENSIONS:
+            names.append(name)
+
+    if len(names) < 2:
+        return []
+
+    patterns = []
+    found_prefixes = set()
+
+    for separator in [' - ', ' – ', ' — ', ' _ ', ' | ']:
+        prefix_candidates = []
+
+        for fname in names:
+            if separator in fname:
+                parts = fname.split(separator)
+                for i in range(1, len(parts)):
+                    prefix_candidates.append(separator.join(parts[:i]) + separator)
+
+        for prefix, count in Counter(prefix_candidates).most_common():
+            if prefix in found_prefixes:
+                continue
+
+            if sum(1 for f in names if f.startswith(prefix)) >= min(3, len(names) * 0.3):
+                patterns.append((prefix, 'prefix'))
+                found_prefixes.add(prefix)
+
+    word_prefix_candidates = []
+
+    for fname in names:
+        words = fname.split()
+        for num_words in range(1, min(4, len(words))):
+            word_prefix_candidates.append(' '.join(words[:num_words]) + ' ')
+
+    for prefix, count in Counter(word_prefix_candidates).most_common():
+        if len(prefix.strip()) < 3:
+            continue
+
+        if prefix in found_prefixes or any(prefix in p for p in found_prefixes):
+            continue
+
+        if sum(1 for f in names if f.startswith(prefix)) >= len(names) * 0.7:
+            patterns.append((prefix, 'prefix'))
+            found_prefixes.add(prefix)
+
+    found_suffixes = set()
+
+    for separator in [' - ', ' – ', ' — ', ' | ', ' ']:
+        suffix_candidates = []
+
+        for fname in names:
+            if separator in fname:
+                parts = fname.rsplit(separator, 3)
+                for i in range(1, len(parts)):
+                    suffix_candidates.append(separator + separator.join(parts[-i:]))
+
+        for suffix, count in Counter(suffix_candidates).most_common():
+            if suffix in found_suffixes:
+                continue
+
+            if sum(1 for f in names if f.endswith(suffix)) >= min(3, len(names) * 0.3):
+                patterns.append((suffix, 'suffix'))
+                found_suffixes.add(suffix)
+
+    patterns.sort(key=lambda x: len(x[0]), reverse=True)
+
+    filtered_patterns = []
+
+    for pattern, ptype in patterns:
+        if not any(ptype == existing_type and pattern in existing_pattern for existing_pattern, existing_type in filtered_patterns):
+            filtered_patterns.append((pattern, ptype))
+
+    return filtered_patterns
+
+
+
+def build_filename_corpus(size: int, seed: int = 42) -> list:
+    # Album-like file names: shared artist/album prefixes, track numbers, shared suffixes
+    generator   = random.Random(seed)
+    artists     = [' '.join(generator.choices(CORPUS_WORDS, k=2)) for _ in range(max(1, size // 50))]
+    suffixes    = ['', '', ' - Remix', ' (Official Video)', ' - Live', ' | HD']
+    separators  = [' - ', ' – ', ' _ ', ' | ']
+    filenames   = []
+
+    for index in range(size):
+        separator   = generator.choice(separators)
+        title       = ' '.join(generator.choices(CORPUS_WORDS, k=generator.randint(1, 4)))
+        name        = f"{generator.choice(artists)}{separator}{index % 20 + 1:02d}{separator}{title}{generator.choice(suffixes)}"
+        filenames.append(name + generator.choice(['.mp3', '.mp3', '.flac', '.m4a']))
+
+    return filenames
+
+
+
+def build_name_corpus(size: int, unique_ratio: float = 0.6, seed: int = 42) -> list:
+    # Names are reused like in a real library (same artists, albums and titles in many places)
+    generator   = random.Random(seed)
+    unique      = [' '.join(generator.choices(CORPUS_WORDS, k=generator.randint(2, 8))) for _ in range(int(size * unique_ratio))]
+
+    return [generator.choice(unique) for _ in range(size)]
+
+
+
+def measure_duration(function, runs: int) -> float:
+    """Best duration (ms) of a function call"""
+    best = None
+
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - started) * 1000
+        best    = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+
+def measure_import_time(module: str, runs: int) -> float:
+    """Best cumulative import time (ms) of a module, from python -X importtime"""
+    best = None
+
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+            capture_output=True, text=True, cwd=REPOSITORY_DIRECTORY
+        )
+
+        if result.returncode != 0:
+            return None
+
+        # Top-level line of the module: "import time: <self> | <cumulative> | <module>"
+        for line in result.stderr.splitlines():
+            match = re.match(r'^import time:\s+\d+ \|\s+(\d+) \| (\S+)$', line)
+
+            if match and match.group(2) == module:
+                cumulative = int(match.group(1)) / 1000
+                best = cumulative if best is None else min(best, cumulative)
+
+    return best
+
+
+
+def measure_startup_time(arguments: list, runs: int) -> float:
+    """Best wall-clock time (ms) of a CLI call, interpreter start included"""
+    best = None
+
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, capture_output=True, cwd=REPOSITORY_DIRECTORY)
+        elapsed = (time.perf_counter() - started) * 1000
+        best    = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+
+def benchmark_import(runs: int) -> None:
+    print(f"⏱️  Import time (python -X importtime, best of {runs})")
+
+    for module in IMPORT_MODULES:
+        duration = measure_import_time(module, runs)
+
+        if duration is None:
+            print(f"   {module:<10} ❌ import failed")
+        else:
+            print(f"   {module:<10} {duration:8.1f} ms")
+
+    print(f"\n⏱️  CLI startup (wall clock, best of {runs})")
+
+    for arguments in STARTUP_CALLS:
+        duration = measure_startup_time(arguments, runs)
+        print(f"   {' '.join(arguments):<24} {duration:8.1f} ms")
+
+
+
+def benchmark_convert(runs: int, size: int) -> None:
+    corpus = build_name_corpus(size)
+
+    # The optimized version must give exactly the same names
+    expected = [convert_name_reference(name) for name in corpus]
+
+    if convert_names(corpus) != expected:
+        print("❌ convert_names output differs from the reference implementation!")
+        sys.exit(1)
+
+    print(f"⏱️  convert_name over {size} names ({len(set(corpus))} unique, best of {runs})")
+
+    def run_cold() -> None:
+        convert_name.cache_clear()
+        convert_names(corpus)
+
+    results = [
+        ('reference (re.sub)',  measure_duration(lambda: [convert_name_reference(name) for name in corpus], runs)),
+        ('precompiled',         measure_duration(lambda: [convert_name.__wrapped__(name) for name in corpus], runs)),
+        ('cached, cold',        measure_duration(run_cold, runs)),
+        ('cached, warm',        measure_duration(lambda: convert_names(corpus), runs)),
+    ]
+
+    reference = results[0][1]
+
+    for label, duration in results:
+        print(f"   {label:<20} {duration:8.1f} ms   x{reference / duration:.1f}")
+
+
+
+def benchmark_patterns(runs: int) -> None:
+    print(f"⏱️  detect_common_patterns scaling (best of {runs})")
+
+    previous = None
+
+    for size in PATTERN_SIZES:
+        filenames   = build_filename_corpus(size)
+        duration    = measure_duration(lambda: detect_common_patterns(filenames), runs)
+        growth      = f"x{duration / previous:.1f} for x2 files" if previous else ''
+        previous    = duration
+
+        # Check the output and compare with the reference while it runs in a reasonable time
+        reference = ''
+
+        if size <= REFERENCE_MAX_SIZE:
+            if detect_common_patterns(filenames) != detect_common_patterns_reference(filenames):
+                print(f"❌ detect_common_patterns output differs from the reference implementation ({size} files)!")
+                sys.exit(1)
+
+            reference = f"reference {measure_duration(lambda: detect_common_patterns_reference(filenames), 1):9.1f} ms"
+
+        print(f"   {size:>6} files {duration:9.1f} ms   {growth:<18} {reference}")
+
+
+
+def build_library_tree(target_path: str, artists: int, albums: int, tracks: int, seed: int = 42) -> int:
+    """Create an artist/album/track tree of empty files, return the number of entries"""
+    generator   = random.Random(seed)
+    entries     = 0
+
+    for artist_index in range(artists):
+        artist = f"{' '.join(generator.choices(CORPUS_WORDS, k=2))} {artist_index}"
+
+        for album_index in range(albums):
+            directory_album = os.path.join(target_path, artist, f"{artist} - Album {album_index}")
+            os.makedirs(directory_album)
+            entries += 1
+
+            for track_index in range(1, tracks + 1):
+                title = ' '.join(generator.choices(CORPUS_WORDS, k=generator.randint(1, 4)))
+
+                with open(os.path.join(directory_album, f"{track_index:02d} - {artist} - {title}.mp3"), 'w'):
+                    pass
+
+            with open(os.path.join(directory_album, 'cover.jpg'), 'w'):
+                pass
+
+            entries += tracks + 1
+
+        entries += 1
+
+    return entries
+
+
+
+def count_syscalls(function, *args) -> Counter:
+    """Run a function and count its file system calls (os.stat, os.scandir...)"""
+    counts      = Counter()
+    originals   = {name: getattr(os, name) for name in COUNTED_SYSCALLS}
+
+    def counted(name, original):
+        def wrapper(*wrapper_args, **wrapper_kwargs):
+            counts[name] += 1
+            return original(*wrapper_args, **wrapper_kwargs)
+
+        return wrapper
+
+    for name, original in originals.items():
+        setattr(os, name, counted(name, original))
+
+    try:
+        function(*args)
+    finally:
+        for name, original in originals.items():
+            setattr(os, name, original)
+
+    return counts
+
+
+
+def benchmark_syscalls(artists: int, albums: int, tracks: int) -> None:
+    directory_root = tempfile.mkdtemp(prefix='benchmark_')
+
+    try:
+        entries = build_library_tree(os.path.join(directory_root, 'library'), artists, albums, tracks)
+
+        # The journal of the benchmark stays out of the data directory
+        journal = RenameJournal(os.path.join(directory_root, 'rename_journal.db'))
+
+        # The output of the renaming is not part of the benchmark
+        with contextlib.redirect_stdout(open(os.devnull, 'w')) as devnull:
+            started = time.perf_counter()
+            counts  = count_syscalls(rename_items_in_directory, os.path.join(directory_root, 'library'), 1, False, journal)
+            elapsed = (time.perf_counter() - started) * 1000
+            devnull.close()
+
+        journal.close()
+
+        print(f"⏱️  folder.rename_items_in_directory on {entries} entries ({artists * albums} albums), {elapsed:.1f} ms")
+
+        for name in COUNTED_SYSCALLS:
+            print(f"   os.{name:<10} {counts[name]:8d}")
+
+        total = sum(counts[name] for name in COUNTED_SYSCALLS if name != 'rename')
+        print(f"   {'total':<13} {total:8d}   ({total / entries:.2f} per entry, renames excluded)")
+
+    finally:
+        shutil.rmtree(directory_root, ignore_errors=True)
+
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmarks of the audio tools")
+    parser.add_argument('name', choices=['import', 'convert', 'patterns', 'syscalls'], help="Benchmark to run")
+    parser.add_argument('--runs', type=int, default=5, help="Number of runs, the best one is kept (default: 5)")
+    parser.add_argument('--size', type=int, default=100000, help="Corpus size of the convert benchmark (default: 100000)")
+    parser.add_argument('--artists', type=int, default=20, help="Artists in the generated tree of the syscalls benchmark (default: 20)")
+    parser.add_argument('--albums', type=int, default=10, help="Albums per artist in the generated tree (default: 10)")
+    parser.add_argument('--tracks', type=int, default=12, help="Tracks per album in the generated tree (default: 12)")
+
+    return parser.parse_args()
+
+
+
+###MAIN###
+if __name__ == "__main__":
+    arguments = parse_arguments()
+
+    if arguments.name == 'import':
+        benchmark_import(arguments.runs)
+
+    elif arguments.name == 'convert':
+        benchmark_convert(arguments.runs, arguments.size)
+
+    elif arguments.name == 'patterns':
+        benchmark_patterns(arguments.runs)
+
+    elif arguments.name == 'syscalls':
+        benchmark_syscalls(arguments.artists, arguments.albums, arguments.tracks)
@@ -0,0 +1,55 @@
+import sys
+import runpy
+
+
+
+###CONSTANTS###
+# Subcommand -> (script module, description). Scripts are only imported when their subcommand runs.
+COMMANDS = {
+    'download'  : ('main',   "Convert YouTube videos or playlists into MP3 files"),
+    'batch'     : ('batch',  "Download a batch of YouTube URLs (file or stdin)"),
+    'folder'    : ('folder', "Rename and normalize audio files in directories"),
+    'tag'       : ('tag',    "Update and standardize audio file metadata"),
+    'rename'    : ('rename', "Remove a pattern from MP3 file names"),
+    'dedup'     : ('dedup',  "Find duplicate audio files (same audio data, tags ignored)"),
+}
+
+
+
+###METHOD###
+def print_usage() -> None:
+    print("💡 Usage: python cli.py <command> [arguments]")
+    print()
+    print("Commands:")
+
+    for command, (_, description) in COMMANDS.items():
+        print(f"   {command:<10} {description}")
+
+    print()
+    print("💡 Help of a command: python cli.py <command> --help")
+
+
+
+def run_command(command: str, arguments: list) -> None:
+    module, _ = COMMANDS[command]
+
+    # Run the script as if it was called directly (its own argument parsing and prompts)
+    sys.argv = [sys.argv[0]] + arguments
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+
+
+
+###MAIN###
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] in ['-h', '--help']:
+        print_usage()
+        sys.exit(0)
+
+    command = sys.argv[1]
+
+    if command not in COMMANDS:
+        print(f"❌ Unknown command: {command}")
+        print_usage()
+        sys.exit(2)
+
+    run_command(command, sys.argv[2:])
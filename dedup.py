@@ -0,0 +1,401 @@
+import os
+import sys
+import mmap
+import hashlib
+import argparse
+
+from collections        import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from main import get_directory_download
+from Tool import walk_library, PathIndex, AUDIO_EXTENSIONS
+
+
+
+###CONSTANTS###
+# Payload hashed by chunks of a memory mapped file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Files hashed in parallel (hashlib releases the GIL on large chunks)
+HASH_JOBS = 4
+
+# Tags at the end of MPEG/AAC files
+ID3V1_SIZE      = 128
+APE_FOOTER_SIZE = 32
+
+
+
+###METHOD###
+def read_at(file_handle, offset: int, size: int) -> bytes:
+    file_handle.seek(offset)
+
+    return file_handle.read(size)
+
+
+
+def get_riff_payload(file_handle, file_size: int) -> tuple:
+    """Range of the data chunk of a WAV file, the whole file when not found"""
+    offset = 12
+
+    # Chunks: name, size (little-endian), data padded to an even size
+    while offset + 8 <= file_size:
+        header      = read_at(file_handle, offset, 8)
+        chunk_size  = int.from_bytes(header[4:8], 'little')
+
+        if header[:4] == b'data':
+            return offset + 8, min(offset + 8 + chunk_size, file_size)
+
+        offset += 8 + chunk_size + chunk_size % 2
+
+    return 0, file_size
+
+
+
+def get_mp4_payload(file_handle, file_size: int) -> tuple:
+    """Range of the media data atom of an MP4 file, the whole file when not found"""
+    offset = 0
+
+    # Atoms: size (big-endian, 1: 64 bits size follows, 0: up to the end of the file), name
+    while offset + 8 <= file_size:
+        header      = read_at(file_handle, offset, 16)
+        atom_size   = int.from_bytes(header[:4], 'big')
+        atom_header = 8
+
+        if atom_size == 1:
+            atom_size   = int.from_bytes(header[8:16], 'big')
+            atom_header = 16
+        elif atom_size == 0:
+            atom_size = file_size - offset
+
+        if atom_size < atom_header:
+            break
+
+        if header[4:8] == b'mdat':
+            return offset + atom_header, min(offset + atom_size, file_size)
+
+        offset += atom_size
+
+    return 0, file_size
+
+
+
+def get_audio_payload(file_path: str, file_size: int) -> tuple:
+    """Range (start, end) of the audio data of a file, tags excluded. Only the headers are read."""
+    with open(file_path, 'rb') as file_handle:
+        header  = file_handle.read(12)
+        start   = 0
+        end     = file_size
+
+        # FLAC: metadata blocks (tags, pictures...) come before the frames
+        if header.startswith(b'fLaC'):
+            start = 4
+
+            while start + 4 <= file_size:
+                block = read_at(file_handle, start, 4)
+                start += 4 + int.from_bytes(block[1:4], 'big')
+
+                if block[0] & 0x80:
+                    break
+
+            return min(start, file_size), end
+
+        # WAV: only the data chunk
+        if header.startswith(b'RIFF') and header[8:12] == b'WAVE':
+            return get_riff_payload(file_handle, file_size)
+
+        # MP4: only the media data atom
+        if header[4:8] == b'ftyp':
+            return get_mp4_payload(file_handle, file_size)
+
+        # Ogg, ASF and unknown formats: tags are interleaved with the audio, the whole file is hashed
+        if not (header.startswith(b'ID3') or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0)):
+            return start, end
+
+        # MPEG/AAC: ID3v2 tags at the start (size is syncsafe, a footer adds 10 bytes)
+        while read_at(file_handle, start, 3) == b'ID3':
+            tag_header  = read_at(file_handle, start, 10)
+            tag_size    = 0
+
+            for byte in tag_header[6:10]:
+                tag_size = (tag_size << 7) | (byte & 0x7F)
+
+            start += 10 + tag_size + (10 if tag_header[5] & 0x10 else 0)
+
+        # ID3v1 and APEv2 tags at the end
+        if end - ID3V1_SIZE >= start and read_at(file_handle, end - ID3V1_SIZE, 3) == b'TAG':
+            end -= ID3V1_SIZE
+
+        if end - APE_FOOTER_SIZE >= start:
+            footer = read_at(file_handle, end - APE_FOOTER_SIZE, APE_FOOTER_SIZE)
+
+            if footer.startswith(b'APETAGEX'):
+                ape_size = int.from_bytes(footer[12:16], 'little')
+
+                # Bit 31 of the flags: the tag has a header too
+                if int.from_bytes(footer[20:24], 'little') & 0x80000000:
+                    ape_size += APE_FOOTER_SIZE
+
+                end = max(start, end - ape_size)
+
+        return min(start, end), end
+
+
+
+def get_payload_checksum(file_path: str, start: int, end: int) -> str:
+    checksum = hashlib.sha256()
+
+    if end > start:
+        with open(file_path, 'rb') as file_handle, mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            view = memoryview(mapping)
+
+            try:
+                for offset in range(start, end, HASH_CHUNK_SIZE):
+                    checksum.update(view[offset:min(offset + HASH_CHUNK_SIZE, end)])
+            finally:
+                view.release()
+
+    return checksum.hexdigest()
+
+
+
+class DedupIndex(PathIndex):
+    """Audio payload (range and checksum) of each file, unchanged files are not read again on the next run"""
+
+    TABLE   = 'files'
+    SCHEMA  = """
+        CREATE TABLE IF NOT EXISTS files (
+            path            TEXT PRIMARY KEY,
+            size            INTEGER NOT NULL,
+            mtime           INTEGER NOT NULL,
+            payload_start   INTEGER NOT NULL,
+            payload_end     INTEGER NOT NULL,
+            checksum        TEXT
+        );
+    """
+
+    def __init__(self, name: str = 'dedup.db'):
+        super().__init__(name)
+
+    def get(self, path: str, stat: os.stat_result) -> tuple:
+        """(payload start, payload end, checksum or None) of an unchanged file, None otherwise"""
+        record = self.lookup(path)
+
+        if record is None or record[0] != stat.st_size or record[1] != stat.st_mtime_ns:
+            return None
+
+        return record[2:]
+
+    def set(self, path: str, stat: os.stat_result, payload_start: int, payload_end: int, checksum: str = None) -> None:
+        self.update(path, (stat.st_size, stat.st_mtime_ns, payload_start, payload_end, checksum))
+
+    def remove(self, path: str) -> None:
+        self.forget(path)
+
+
+
+def find_audio_files(target_path: str) -> list:
+    """Every audio file of the tree: (path, stat)"""
+    files = []
+
+    for directory, _, items in walk_library(target_path):
+        for item in sorted(items):
+            if os.path.splitext(item)[1].lower() in AUDIO_EXTENSIONS:
+                path = os.path.join(directory, item)
+
+                try:
+                    files.append((path, os.stat(path)))
+                except OSError as e:
+                    print(f"⚠️ Cannot read {path}: {e}")
+
+    return files
+
+
+
+def find_duplicates(target_path: str, index: DedupIndex, jobs: int = HASH_JOBS) -> list:
+    """Groups of files with the same audio payload (hard links of one file count once), paths sorted"""
+    files       = find_audio_files(target_path)
+    payloads    = {}
+
+    print(f"📁 Found {len(files)} audio file(s)")
+
+    # Payload ranges come from the index or from the file headers (no full read)
+    for path, stat in files:
+        record = index.get(path, stat)
+
+        if record is None:
+            try:
+                record = get_audio_payload(path, stat.st_size) + (None,)
+            except OSError as e:
+                print(f"⚠️ Cannot read {path}: {e}")
+                continue
+
+            index.set(path, stat, *record)
+
+        payloads[path] = (stat, record)
+
+    # Size pre-filter: only payloads of the same size can be duplicates.
+    # Empty payloads (truncated or unparsable files) all hash the same, they are never duplicates.
+    buckets = defaultdict(list)
+
+    for path, (stat, (start, end, _)) in payloads.items():
+        if end > start:
+            buckets[end - start].append(path)
+
+    candidates = [
+        path for paths in buckets.values()
+        if len({(payloads[path][0].st_dev, payloads[path][0].st_ino) for path in paths}) > 1
+        for path in paths
+    ]
+
+    # Only candidates without a checksum yet are hashed
+    to_hash = [path for path in candidates if payloads[path][1][2] is None]
+
+    if to_hash:
+        print(f"🔍 Hashing {len(to_hash)} file(s) ({len(candidates)} candidate(s) with the same payload size)")
+
+    def hash_file(path: str) -> None:
+        stat, (start, end, _) = payloads[path]
+
+        try:
+            checksum = get_payload_checksum(path, start, end)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Cannot hash {path}: {e}")
+            return
+
+        payloads[path] = (stat, (start, end, checksum))
+        index.set(path, stat, start, end, checksum)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(hash_file, to_hash))
+
+    groups = defaultdict(list)
+
+    for path in candidates:
+        stat, (start, end, checksum) = payloads[path]
+
+        if checksum is not None:
+            groups[(end - start, checksum)].append(path)
+
+    duplicates = []
+
+    for paths in groups.values():
+        # Hard links of the same file are not duplicates, the first path of each inode stands for it
+        inodes = {}
+
+        for path in sorted(paths):
+            stat = payloads[path][0]
+            inodes.setdefault((stat.st_dev, stat.st_ino), path)
+
+        if len(inodes) > 1:
+            duplicates.append(sorted(inodes.values()))
+
+    return sorted(duplicates)
+
+
+
+def link_file(source: str, target: str) -> None:
+    # The hard link is created beside the target then moved over it: the target is never missing
+    link_temp = f"{target}.dedup"
+    os.link(source, link_temp)
+
+    try:
+        os.replace(link_temp, target)
+    except OSError:
+        os.remove(link_temp)
+        raise
+
+
+
+def remove_duplicates(duplicates: list, index: DedupIndex, action: str = None) -> int:
+    """Report each group (the first path is kept), then hard link or remove the others. Return the bytes reclaimed."""
+    reclaimed = 0
+
+    for paths in duplicates:
+        keep = paths[0]
+
+        print(f"🔁 {keep}")
+
+        # The kept file must still be the one scanned (same size and mtime), the others are replaced by it
+        try:
+            record = index.get(keep, os.stat(keep))
+        except OSError:
+            record = None
+
+        if action is not None and record is None:
+            print(f"   ⚠️ Changed since the scan, group skipped (run again)")
+            continue
+
+        for path in paths[1:]:
+            # Tags may differ, so each duplicate frees its own size (read before it is linked or removed)
+            try:
+                size = os.stat(path).st_size
+            except OSError as e:
+                print(f"   ❌ Error with {path}: {e}")
+                continue
+
+            if action is None:
+                print(f"   = {path}")
+                reclaimed += size
+                continue
+
+            try:
+                if action == 'link':
+                    link_file(keep, path)
+                    index.set(path, os.stat(path), *record)
+                    print(f"   🔗 Linked: {path}")
+                else:
+                    os.remove(path)
+                    index.remove(path)
+                    print(f"   🗑️ Removed: {path}")
+
+                reclaimed += size
+
+            except OSError as e:
+                print(f"   ❌ Error with {path}: {e}")
+
+    return reclaimed
+
+
+
+###MAIN###
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find audio files with the same audio data (tags ignored)")
+    parser.add_argument('path', nargs='?', default=get_directory_download(), help="Library directory (default: ~/download/)")
+    parser.add_argument('-j', '--jobs', type=int, default=HASH_JOBS, help=f"Number of files hashed in parallel (default: {HASH_JOBS})")
+    parser.add_argument('--link', action='store_true', help="Replace duplicates with hard links to the kept file (its tags are shared)")
+    parser.add_argument('--remove', action='store_true', help="Remove duplicates, only the first path of each group is kept")
+    arguments = parser.parse_args()
+
+    if arguments.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    if arguments.link and arguments.remove:
+        parser.error("--link and --remove cannot be combined")
+
+    target_path = os.path.abspath(os.path.expanduser(arguments.path))
+
+    if not os.path.isdir(target_path):
+        print(f"❌ Path is not a directory: {target_path}")
+        sys.exit(2)
+
+    print(f"📂 Library: {target_path}")
+
+    # Payload ranges and checksums of unchanged files (same size and mtime) come from the index
+    index   = DedupIndex()
+    action  = 'link' if arguments.link else 'remove' if arguments.remove else None
+
+    try:
+        duplicates  = find_duplicates(target_path, index, arguments.jobs)
+        reclaimed   = remove_duplicates(duplicates, index, action)
+        index.save(target_path)
+    finally:
+        index.close()
+
+    files = sum(len(paths) - 1 for paths in duplicates)
+
+    if action is None:
+        print(f"\n📋 {len(duplicates)} group(s), {files} duplicate file(s), {reclaimed / 1024 / 1024:.1f} MiB reclaimable (--link or --remove)")
+    else:
+        print(f"\n📋 {len(duplicates)} group(s), {files} duplicate file(s), {reclaimed / 1024 / 1024:.1f} MiB reclaimed")
+
+    print("✨ All done!")
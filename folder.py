@@ -1,14 +1,47 @@
 import os
 import re
 import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
 
-from collections import Counter
+from bisect             import bisect_left
+from collections        import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-from Tool import convert_name, AUDIO_EXTENSIONS
+from Tool import convert_names, is_working_directory, open_database, PathIndex, AUDIO_EXTENSIONS
+
+
+
+###CONSTANTS###
+# Prefix of the hidden names used to break rename cycles (A -> B, B -> A)
+TEMPORARY_PREFIX = '.renaming-'
+
+# Directory mtimes more recent than this (coarsest file system timestamps) are not trusted by the index
+MTIME_RESOLUTION_NS = 2 * 10**9
 
 
 
 ###METHOD###
+def count_names_with_prefix(sorted_names: list, prefix: str) -> int:
+    """Number of names starting with prefix, found by binary search in the sorted names (implicit prefix trie)"""
+    start = bisect_left(sorted_names, prefix)
+
+    # Names starting with prefix are a contiguous block: [prefix, prefix with its last character incremented)
+    if ord(prefix[-1]) < sys.maxunicode:
+        return bisect_left(sorted_names, prefix[:-1] + chr(ord(prefix[-1]) + 1), start) - start
+
+    end = start
+
+    while end < len(sorted_names) and sorted_names[end].startswith(prefix):
+        end += 1
+
+    return end - start
+
+
+
 def detect_common_patterns(filenames: list) -> list:
     """Detect common prefixes and suffixes in a list of filenames (without path)"""
     # Filter to only audio files and extract names without extension
@@ -21,6 +54,10 @@ def detect_common_patterns(filenames: list) -> list:
     if len(names) < 2:
         return []
 
+    # Sorted names (prefix lookups) and sorted reversed names (suffix lookups), built once
+    sorted_names            = sorted(names)
+    sorted_reversed_names   = sorted(name[::-1] for name in names)
+
     patterns = []
     found_prefixes = set()
 
@@ -51,7 +88,7 @@ def detect_common_patterns(filenames: list) -> list:
                     continue
 
                 # If at least 3 files start with this prefix (minimum threshold)
-                files_starting_with_prefix = sum(1 for f in names if f.startswith(prefix))
+                files_starting_with_prefix = count_names_with_prefix(sorted_names, prefix)
 
                 if files_starting_with_prefix >= min(3, len(names) * 0.3):
                     patterns.append((prefix, 'prefix'))
@@ -71,21 +108,27 @@ def detect_common_patterns(filenames: list) -> list:
     if word_prefix_candidates:
         prefix_counts = Counter(word_prefix_candidates)
 
+        # Found prefixes joined in one text (file names never contain NUL), for substring checks in C
+        found_prefixes_text = '\0'.join(found_prefixes)
+
         for prefix, count in prefix_counts.most_common():
             # Skip short prefixes (less than 3 chars before space)
             if len(prefix.strip()) < 3:
                 continue
 
+            files_starting_with_prefix = count_names_with_prefix(sorted_names, prefix)
+
+            # Need higher threshold for word-based prefixes (70% of files)
+            if files_starting_with_prefix < len(names) * 0.7:
+                continue
+
             # Skip if already found or is substring of existing prefix
-            if prefix in found_prefixes or any(prefix in p for p in found_prefixes):
+            if prefix in found_prefixes_text:
                 continue
 
-            files_starting_with_prefix = sum(1 for f in names if f.startswith(prefix))
-
-            # Need higher threshold for word-based prefixes (70% of files)
-            if files_starting_with_prefix >= len(names) * 0.7:
-                patterns.append((prefix, 'prefix'))
-                found_prefixes.add(prefix)
+            patterns.append((prefix, 'prefix'))
+            found_prefixes.add(prefix)
+            found_prefixes_text += '\0' + prefix
 
     # Try to find common suffixes at the end of filenames
     found_suffixes = set()
@@ -109,7 +152,8 @@ def detect_common_patterns(filenames: list) -> list:
                 if suffix in found_suffixes:
                     continue
 
-                files_ending_with_suffix = sum(1 for f in names if f.endswith(suffix))
+                # A suffix of the name is a prefix of the reversed name
+                files_ending_with_suffix = count_names_with_prefix(sorted_reversed_names, suffix[::-1])
 
                 if files_ending_with_suffix >= min(3, len(names) * 0.3):
                     patterns.append((suffix, 'suffix'))
@@ -119,19 +163,16 @@ def detect_common_patterns(filenames: list) -> list:
     patterns.sort(key=lambda x: len(x[0]), reverse=True)
 
     # Remove redundant patterns (patterns that are substrings of longer patterns of same type)
-    filtered_patterns = []
+    # Kept patterns of each type are joined in one text, so each check is a single substring search
+    filtered_patterns   = []
+    kept_patterns_text  = {'prefix': '', 'suffix': ''}
 
     for pattern, ptype in patterns:
-        # Check if this pattern is a substring of an already added longer pattern of same type
-        is_redundant = False
-
-        for existing_pattern, existing_type in filtered_patterns:
-            if ptype == existing_type and pattern in existing_pattern:
-                is_redundant = True
-                break
+        if pattern in kept_patterns_text[ptype]:
+            continue
 
-        if not is_redundant:
-            filtered_patterns.append((pattern, ptype))
+        filtered_patterns.append((pattern, ptype))
+        kept_patterns_text[ptype] += pattern + '\0'
 
     return filtered_patterns
 
@@ -177,22 +218,31 @@ def clean_html_39(filename: str) -> str:
 
 
 
-def should_remove_track_numbers(items: list, target_path: str) -> bool:
+def scan_directory(target_path: str) -> list:
+    """List a directory in one os.scandir pass: (name, is_file, is_dir) for each entry"""
+    # DirEntry types come from the directory listing itself, no stat call per entry
+    # Working directories of main.py are skipped, their in-flight downloads must keep their names
+    with os.scandir(target_path) as entries:
+        return [
+            (entry.name, entry.is_file(), entry.is_dir()) for entry in entries
+            if not (entry.is_dir() and is_working_directory(entry.name))
+        ]
+
+
+
+def should_remove_track_numbers(files: list) -> bool:
     audio_files         = []
     files_with_numbers  = 0
 
-    for item in items:
-        item_path = os.path.join(target_path, item)
-
-        if os.path.isfile(item_path):
-            name, ext = os.path.splitext(item)
+    for item in files:
+        name, ext = os.path.splitext(item)
 
-            if ext.lower() in AUDIO_EXTENSIONS:
-                audio_files.append(name)
+        if ext.lower() in AUDIO_EXTENSIONS:
+            audio_files.append(name)
 
-                # Check if filename starts with a number followed by separator
-                if re.match(r'^\d+[\s\.\-_]+', name):
-                    files_with_numbers += 1
+            # Check if filename starts with a number followed by separator
+            if re.match(r'^\d+[\s\.\-_]+', name):
+                files_with_numbers += 1
 
     # If no audio files, return False
     if len(audio_files) == 0:
@@ -218,51 +268,107 @@ def remove_track_number(filename: str, should_remove: bool) -> str:
 
 
 
-def rename_items_in_directory(target_path: str) -> None:
-    if not os.path.exists(target_path):
-        print(f"❌ Path does not exist: {target_path}")
-        return
+def scan_directory_or_report(target_path: str, output = print) -> list:
+    """scan_directory, errors are reported and give None"""
+    try:
+        return scan_directory(target_path)
+    except FileNotFoundError:
+        output(f"❌ Path does not exist: {target_path}")
+    except NotADirectoryError:
+        output(f"❌ Path is not a directory: {target_path}")
+    except PermissionError:
+        output(f"⚠️ Permission denied: {target_path}")
 
-    if not os.path.isdir(target_path):
-        print(f"❌ Path is not a directory: {target_path}")
-        return
+    return None
 
-    print(f"📁 Processing directory: {target_path}")
 
-    # Get all items in directory (files and folders)
-    items = []
-    try:
-        items = os.listdir(target_path)
-    except PermissionError:
-        print(f"⚠️ Permission denied: {target_path}")
-        return
 
-    # First, process subdirectories recursively (depth-first)
-    for item in items:
-        item_path = os.path.join(target_path, item)
+def get_temporary_name(name: str, names_taken: set) -> str:
+    # Hidden name, unique in the directory (lowercase, case-insensitive file systems included)
+    index = 0
 
-        if os.path.isdir(item_path):
-            # Recursively process subdirectory
-            rename_items_in_directory(item_path)
+    while True:
+        temporary_name = f"{TEMPORARY_PREFIX}{index}-{name}"
 
-    # Then rename items in current directory (after subdirectories are processed)
-    items = os.listdir(target_path)
+        if temporary_name.lower() not in names_taken:
+            names_taken.add(temporary_name.lower())
+            return temporary_name
 
-    # HTML '39' artifacts are always cleaned (from &#39; bug)
-    print(f"   🧹 Cleaning HTML '39' artifacts (from &#39;)")
+        index += 1
 
-    # Analyze if track numbers should be removed from this directory
-    should_remove = should_remove_track_numbers(items, target_path)
 
-    if should_remove:
-        print(f"   🔢 Track numbers detected, will remove them")
+
+def order_directory_renames(target_path: str, items: list, renames: list, output = print) -> list:
+    """Order the renames of one directory so nothing is overwritten, return (directory, source, target) operations"""
+    # Names are compared lowercase: a clash on a case-insensitive file system is a clash
+    accepted = dict(renames)
+
+    # Drop renames whose target is taken by an item that stays (or by an earlier rename), until nothing changes
+    while True:
+        staying = {item.lower() for item in items if item not in accepted}
+        targets = set()
+        dropped = []
+
+        for source, target in accepted.items():
+            if target.lower() in staying or target.lower() in targets:
+                dropped.append((source, target))
+            else:
+                targets.add(target.lower())
+
+        if not dropped:
+            break
+
+        for source, target in dropped:
+            output(f"⚠️ Target already exists, skipping: {source} -> {target}")
+            del accepted[source]
+
+    operations  = []
+    occupants   = {source.lower(): source for source in accepted}
+    names_taken = {item.lower() for item in items} | targets
+
+    while accepted:
+        # Follow the chain of renames blocked by each other (A -> B while B -> C is pending)
+        source  = next(iter(accepted))
+        chain   = [source]
+        seen    = {source}
+        blocker = occupants.get(accepted[source].lower())
+
+        while blocker is not None and blocker not in seen:
+            chain.append(blocker)
+            seen.add(blocker)
+            blocker = occupants.get(accepted[blocker].lower())
+
+        # Cycle (A -> B, B -> A): one item is moved aside to a temporary name, which breaks it
+        if blocker is not None and blocker != chain[-1]:
+            temporary_name = get_temporary_name(blocker, names_taken)
+            operations.append((target_path, blocker, temporary_name))
+
+            accepted[temporary_name] = accepted.pop(blocker)
+            del occupants[blocker.lower()]
+            occupants[temporary_name.lower()] = temporary_name
+            continue
+
+        # The end of the chain has a free target (or only changes case): renamed from the end
+        for source in reversed(chain):
+            operations.append((target_path, source, accepted.pop(source)))
+            del occupants[source.lower()]
+
+    return operations
+
+
+
+def analyse_directory(entries: list) -> tuple:
+    """Analysis of one directory: (common patterns, whether track numbers are removed)"""
+    files = [item for item, is_file, _ in entries if is_file]
+
+    # Analyze if track numbers should be removed from this directory
+    should_remove = should_remove_track_numbers(files)
 
     # Detect common patterns in filenames (using cleaned names without 39 artifacts)
     # Create a temporary list of cleaned names for pattern detection
     cleaned_items_for_detection = []
-    for item in items:
-        item_path = os.path.join(target_path, item)
-        if os.path.isfile(item_path):
+    for item, is_file, _ in entries:
+        if is_file:
             name, ext = os.path.splitext(item)
             if ext.lower() in AUDIO_EXTENSIONS:
                 cleaned_name = clean_html_39(item)
@@ -274,23 +380,41 @@ def rename_items_in_directory(target_path: str) -> None:
 
     common_patterns = detect_common_patterns(cleaned_items_for_detection)
 
+    return common_patterns, should_remove
+
+
+
+def plan_directory(target_path: str, entries: list, output = print, analysis: tuple = None) -> tuple:
+    """Compute the renames of one directory (without touching it), return (ordered operations, analysis)"""
+    items = [item for item, _, _ in entries]
+
+    # Analysis of an unchanged name set is reused from the index
+    common_patterns, should_remove = analysis or analyse_directory(entries)
+
+    # HTML '39' artifacts are always cleaned (from &#39; bug)
+    output(f"   🧹 Cleaning HTML '39' artifacts (from &#39;)")
+
+    if should_remove:
+        output(f"   🔢 Track numbers detected, will remove them")
+
     if common_patterns:
         prefixes = [(p, t) for p, t in common_patterns if t == 'prefix']
         suffixes = [(p, t) for p, t in common_patterns if t == 'suffix']
 
         if prefixes:
-            print(f"   🎯 Common prefixes detected:")
+            output(f"   🎯 Common prefixes detected:")
             for pattern, _ in prefixes:
-                print(f"      - '{pattern}'")
+                output(f"      - '{pattern}'")
 
         if suffixes:
-            print(f"   🎯 Common suffixes detected:")
+            output(f"   🎯 Common suffixes detected:")
             for pattern, _ in suffixes:
-                print(f"      - '{pattern}'")
+                output(f"      - '{pattern}'")
 
-    for item in items:
-        old_path = os.path.join(target_path, item)
+    # Clean every name first, then convert them all in one batch
+    names_cleaned = []
 
+    for item in items:
         # Get name without extension
         name, ext = os.path.splitext(item)
 
@@ -299,36 +423,485 @@ def rename_items_in_directory(target_path: str) -> None:
 
         # Remove common patterns (before conversion)
         name_cleaned = remove_common_patterns(name_cleaned, common_patterns)
-        name_cleaned_no_ext, ext = os.path.splitext(name_cleaned)
+        names_cleaned.append(os.path.splitext(name_cleaned))
 
-        # Convert name
-        new_name = convert_name(name_cleaned_no_ext)
+    # Convert names
+    new_names = convert_names(name for name, _ in names_cleaned)
 
+    renames = []
+
+    for item, (_, ext), new_name in zip(items, names_cleaned, new_names):
         # Remove track number for audio files (only if analysis determined it's needed)
         new_filename = remove_track_number(new_name + ext, should_remove)
 
-        # Build new path
-        new_path = os.path.join(target_path, new_filename)
-
         # Rename if different
-        if old_path != new_path:
-            # Check if target already exists
-            if os.path.exists(new_path):
-                print(f"⚠️ Target already exists, skipping: {item} -> {new_filename}")
-            else:
-                try:
-                    os.rename(old_path, new_path)
-                    print(f"✅ Renamed: {item} -> {new_filename}")
-                except Exception as e:
-                    print(f"❌ Error renaming {item}: {e}")
+        if item != new_filename:
+            renames.append((item, new_filename))
+
+    return order_directory_renames(target_path, items, renames, output), (common_patterns, should_remove)
+
+
+
+def get_names_hash(entries: list) -> str:
+    # Hash of the name set (with the type of each entry), independent of the scan order
+    names = sorted(f"{'d' if is_dir else 'f'}{item}" for item, _, is_dir in entries)
+
+    return hashlib.sha1('\0'.join(names).encode('utf-8', 'surrogateescape')).hexdigest()
+
+
+
+class RenameIndex(PathIndex):
+    """Fingerprint and analysis of each processed directory, unchanged directories are skipped on the next run"""
+
+    TABLE   = 'directories'
+    SCHEMA  = """
+        CREATE TABLE IF NOT EXISTS directories (
+            path                    TEXT PRIMARY KEY,
+            mtime                   INTEGER,
+            entries                 INTEGER NOT NULL,
+            names_hash              TEXT NOT NULL,
+            patterns                TEXT NOT NULL,
+            remove_track_numbers    INTEGER NOT NULL,
+            subdirectories          TEXT NOT NULL,
+            clean                   INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, name: str = 'rename_index.db'):
+        super().__init__(name)
+
+    def load_record(self, values: tuple) -> dict:
+        mtime, entries, names_hash, patterns, remove_track_numbers, subdirectories, clean = values
+
+        return {
+            'mtime'             : mtime,
+            'entries'           : entries,
+            'names_hash'        : names_hash,
+            'patterns'          : [tuple(pattern) for pattern in json.loads(patterns)],
+            'should_remove'     : bool(remove_track_numbers),
+            'subdirectories'    : json.loads(subdirectories),
+            'clean'             : bool(clean),
+        }
+
+    def dump_record(self, record: dict) -> tuple:
+        return (
+            record['mtime'], record['entries'], record['names_hash'], json.dumps(record['patterns']),
+            int(record['should_remove']), json.dumps(record['subdirectories']), int(record['clean'])
+        )
+
+    def get(self, path: str) -> dict:
+        return self.lookup(path)
+
+    def set(self, path: str, record: dict) -> None:
+        self.update(path, record)
+
+
+
+def plan_directory_indexed(target_path: str, output = print, index: RenameIndex = None) -> tuple:
+    """Plan one directory: (subdirectory paths, operations, skipped), None when it cannot be read"""
+    record  = None
+    mtime   = None
+
+    if index is not None:
+        record = index.get(target_path)
+
+        try:
+            mtime = os.stat(target_path).st_mtime_ns
+        except OSError:
+            record = None
+
+        # Unchanged since a run that left it clean: one stat, no scan
+        if record and record['clean'] and record['mtime'] == mtime:
+            return [os.path.join(target_path, item) for item in record['subdirectories']], [], True
+
+    entries = scan_directory_or_report(target_path, output)
+
+    if entries is None:
+        return None
+
+    output(f"📁 Processing directory: {target_path}")
+
+    subdirectories  = [item for item, _, is_dir in entries if is_dir]
+    analysis        = None
+
+    if index is not None:
+        names_hash = get_names_hash(entries)
+
+        # Same names (only the mtime changed): the analysis is reused
+        if record and record['entries'] == len(entries) and record['names_hash'] == names_hash:
+            analysis = (record['patterns'], record['should_remove'])
+
+    operations, (common_patterns, should_remove) = plan_directory(target_path, entries, output, analysis)
+
+    if index is not None:
+        index.set(target_path, {
+            # A mtime too recent may hide a change made in the same tick, it is not trusted
+            'mtime'             : mtime if mtime is not None and time.time_ns() - mtime > MTIME_RESOLUTION_NS else None,
+            'entries'           : len(entries),
+            'names_hash'        : names_hash,
+            'patterns'          : common_patterns,
+            'should_remove'     : should_remove,
+            'subdirectories'    : subdirectories,
+            'clean'             : not operations,
+        })
+
+    return [os.path.join(target_path, item) for item in subdirectories], operations, False
+
+
+
+def plan_directory_tree(target_path: str, jobs: int = 1, index: RenameIndex = None) -> tuple:
+    """Compute the rename plan of a whole tree in memory, subdirectories before their parent.
+    Return (operations, number of unchanged directories skipped)"""
+    # Parallel mode: directories are planned on a worker pool
+    if jobs > 1:
+        return plan_directory_tree_parallel(target_path, jobs, index)
+
+    result = plan_directory_indexed(target_path, print, index)
+
+    if result is None:
+        return [], 0
+
+    subdirectories, operations_directory, skipped = result
+    operations = []
+
+    # Subdirectories first (depth-first): their renames are applied before the parent ones
+    for path in subdirectories:
+        operations_child, skipped_child = plan_directory_tree(path, 1, index)
+        operations.extend(operations_child)
+        skipped += skipped_child
+
+    # Then items of the current directory (paths of subdirectories stay valid until then)
+    operations.extend(operations_directory)
+
+    return operations, int(skipped)
+
+
+
+def plan_directory_tree_parallel(target_path: str, jobs: int, index: RenameIndex = None) -> tuple:
+    """Plan directories on a worker pool (plans of directories are independent), output grouped per directory"""
+    executor    = ThreadPoolExecutor(max_workers=jobs)
+    lock        = threading.Lock()
+    output_lock = threading.Lock()
+    finished    = threading.Event()
+    plans       = {}
+    children    = {}
+    running     = [0]
+    skipped     = [0]
+
+    def submit(path: str) -> None:
+        with lock:
+            running[0] += 1
+
+        executor.submit(plan_job, path)
+
+    def plan_job(path: str) -> None:
+        lines = []
+
+        try:
+            result = plan_directory_indexed(path, lines.append, index)
+
+            if result is not None:
+                children[path], plans[path], skipped_directory = result
+
+                for child in children[path]:
+                    submit(child)
+
+                if skipped_directory:
+                    with lock:
+                        skipped[0] += 1
+
+        except Exception as e:
+            lines.append(f"❌ Error processing {path}: {e}")
+
+        finally:
+            # Output of one directory is printed as one block, never interleaved
+            if lines:
+                with output_lock:
+                    print('\n'.join(lines))
+
+            with lock:
+                running[0] -= 1
+
+                if running[0] == 0:
+                    finished.set()
+
+    submit(target_path)
+    finished.wait()
+    executor.shutdown(wait=True)
+
+    # Same order as the sequential mode: subdirectories (in scan order) before their parent
+    def collect(path: str, operations: list) -> list:
+        for child in children.get(path, []):
+            collect(child, operations)
+
+        operations.extend(plans.get(path, []))
+
+        return operations
+
+    return collect(target_path, []), skipped[0]
+
+
+
+def print_rename_plan(operations: list) -> None:
+    directory_current = None
+
+    for directory, source, target in operations:
+        if directory != directory_current:
+            directory_current = directory
+            print(f"📁 {directory}")
+
+        print(f"📝 Would rename: {source} -> {target}")
+
+    print(f"📋 {len(operations)} rename(s) planned, no file changed (dry run)")
+
+
+
+class RenameJournal:
+    """Operations of the last rename plan, kept on disk to resume or roll back an interrupted run"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS operations (
+            id          INTEGER PRIMARY KEY,
+            directory   TEXT NOT NULL,
+            source      TEXT NOT NULL,
+            target      TEXT NOT NULL,
+            status      TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, name: str = 'rename_journal.db'):
+        self.connection = open_database(name, self.SCHEMA)
+
+        # One commit per rename: no fsync per commit (still safe if the process is killed)
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+    def start(self, operations: list) -> None:
+        # The whole plan is written in one transaction before the first rename
+        with self.connection:
+            self.connection.execute('DELETE FROM operations')
+            self.connection.executemany(
+                "INSERT INTO operations (directory, source, target, status) VALUES (?, ?, ?, 'pending')",
+                operations
+            )
+
+    def get_operations(self, status: str) -> list:
+        return self.connection.execute(
+            'SELECT id, directory, source, target FROM operations WHERE status = ? ORDER BY id', (status,)
+        ).fetchall()
+
+    def set_status(self, operation_id: int, status: str) -> None:
+        with self.connection:
+            self.connection.execute('UPDATE operations SET status = ? WHERE id = ?', (status, operation_id))
+
+    def is_interrupted(self) -> bool:
+        return self.connection.execute("SELECT 1 FROM operations WHERE status = 'pending' LIMIT 1").fetchone() is not None
+
+    def clear(self) -> None:
+        with self.connection:
+            self.connection.execute('DELETE FROM operations')
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+
+def is_name_taken(source_path: str, target_path: str) -> bool:
+    """Whether renaming would overwrite another item (os.rename silently replaces it on POSIX)"""
+    if not os.path.lexists(target_path):
+        return False
+
+    # Case-only rename on a case-insensitive file system: the target found is the item itself
+    try:
+        source_stat = os.lstat(source_path)
+        target_stat = os.lstat(target_path)
+    except OSError:
+        return True
+
+    return (source_stat.st_dev, source_stat.st_ino) != (target_stat.st_dev, target_stat.st_ino)
+
+
+
+def apply_rename_plan(journal: RenameJournal, resume: bool = False) -> int:
+    """Apply the pending operations of the journal in order, return the number of failed or skipped renames"""
+    directory_current   = None
+    failed              = 0
+
+    # Per directory, lowercase: names a failed operation did not create, items moved aside to a temporary name
+    missing     = set()
+    moved_aside = {}
+
+    def restore_moved_aside(temporary_name: str) -> None:
+        # The cycle was not completed: the item moved aside gets its original name back instead of staying hidden
+        operation_id, original = moved_aside.pop(temporary_name.lower(), (None, None))
+
+        if original is None:
+            return
+
+        original_path = os.path.join(directory_current, original)
+
+        if os.path.lexists(original_path):
+            print(f"⚠️ Original name already exists, left as {temporary_name}: {original}")
+            return
+
+        try:
+            os.rename(os.path.join(directory_current, temporary_name), original_path)
+        except Exception as e:
+            print(f"❌ Error restoring {original}: {e}")
+            return
+
+        journal.set_status(operation_id, 'rolled back')
+        print(f"↩️ Restored: {original}")
+
+    for operation_id, directory, source, target in journal.get_operations('pending'):
+        if directory != directory_current:
+            directory_current   = directory
+            missing             = set()
+            moved_aside         = {}
+            print(f"📁 Renaming in: {directory}")
+
+        source_path = os.path.join(directory, source)
+        target_path = os.path.join(directory, target)
+
+        # Resumed plan: the interrupted run may have renamed this item before writing it in the journal
+        if resume and not os.path.lexists(source_path) and os.path.lexists(target_path):
+            journal.set_status(operation_id, 'done')
+            continue
+
+        # The previous link of the chain (or cycle) failed, the item to rename is not there
+        if source.lower() in missing:
+            print(f"⏭️ Skipped, depends on a failed rename: {source} -> {target}")
+            journal.set_status(operation_id, 'skipped')
+            missing.add(target.lower())
+            failed += 1
+            continue
+
+        # Never overwrite an item: a failed link of the chain left it in place, or the directory changed since planning
+        if is_name_taken(source_path, target_path):
+            print(f"⚠️ Target already exists, skipping: {source} -> {target}")
+            journal.set_status(operation_id, 'skipped')
+            missing.add(target.lower())
+            restore_moved_aside(source)
+            failed += 1
+            continue
+
+        try:
+            os.rename(source_path, target_path)
+        except Exception as e:
+            print(f"❌ Error renaming {source}: {e}")
+            journal.set_status(operation_id, 'failed')
+            missing.add(target.lower())
+            restore_moved_aside(source)
+            failed += 1
+            continue
+
+        journal.set_status(operation_id, 'done')
+
+        if target.startswith(TEMPORARY_PREFIX):
+            moved_aside[target.lower()] = (operation_id, source)
+        else:
+            moved_aside.pop(source.lower(), None)
+            print(f"✅ Renamed: {source} -> {target}")
+
+    return failed
+
+
+
+def rollback_rename_plan(journal: RenameJournal) -> int:
+    """Undo the applied operations of the journal (last one first), return the number of failed renames"""
+    failed = 0
+
+    for operation_id, directory, source, target in reversed(journal.get_operations('done')):
+        source_path = os.path.join(directory, source)
+        target_path = os.path.join(directory, target)
+
+        if is_name_taken(target_path, source_path):
+            print(f"⚠️ Original name already exists, skipping: {target} -> {source}")
+            failed += 1
+            continue
+
+        try:
+            os.rename(target_path, source_path)
+        except Exception as e:
+            print(f"❌ Error renaming {target}: {e}")
+            failed += 1
+            continue
+
+        journal.set_status(operation_id, 'rolled back')
+
+        if not target.startswith(TEMPORARY_PREFIX):
+            print(f"↩️ Restored: {target} -> {source}")
+
+    return failed
+
+
+
+def rename_items_in_directory(target_path: str, jobs: int = 1, dry_run: bool = False, journal: RenameJournal = None, index: RenameIndex = None) -> int:
+    """Plan the renames of the whole tree, then apply them in one journaled batch (or only print them)"""
+    operations, skipped = plan_directory_tree(target_path, jobs, index)
+
+    if skipped:
+        print(f"⏭️ {skipped} unchanged director{'y' if skipped == 1 else 'ies'} skipped (index)")
+
+    if index is not None:
+        index.save(target_path)
+
+    if dry_run:
+        print_rename_plan(operations)
+        return 0
+
+    journal_own = journal is None
+    journal     = journal or RenameJournal()
+
+    try:
+        journal.start(operations)
+        return apply_rename_plan(journal)
+    finally:
+        if journal_own:
+            journal.close()
 
 
 
 ###MAIN###
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rename and normalize audio files in a directory tree")
+    parser.add_argument('path', nargs='?', help="Target directory (asked when missing)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Number of directories planned in parallel (default: 1)")
+    parser.add_argument('--dry-run', action='store_true', help="Only print the planned renames, no file is changed")
+    parser.add_argument('--resume', action='store_true', help="Resume the interrupted rename plan")
+    parser.add_argument('--rollback', action='store_true', help="Undo the last (or interrupted) rename plan")
+    parser.add_argument('--no-index', action='store_true', help="Process every directory, even the ones unchanged since the last run")
+    arguments = parser.parse_args()
+
+    if arguments.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    if sum([arguments.dry_run, arguments.resume, arguments.rollback]) > 1:
+        parser.error("--dry-run, --resume and --rollback cannot be combined")
+
+    # Resume or rollback only use the journal, no directory is scanned
+    if arguments.resume or arguments.rollback:
+        journal = RenameJournal()
+
+        try:
+            if arguments.resume:
+                failed = apply_rename_plan(journal, resume=True)
+            else:
+                failed = rollback_rename_plan(journal)
+
+                # A partial rollback keeps the journal, so --rollback can be run again for the remaining renames
+                if failed:
+                    print(f"⚠️ {failed} rename(s) not rolled back, journal kept")
+                else:
+                    journal.clear()
+        finally:
+            journal.close()
+
+        print("✨ All done!")
+        sys.exit(1 if failed else 0)
+
     # Check if path provided as command line argument
-    if len(sys.argv) > 1:
-        target_path = sys.argv[1]
+    if arguments.path:
+        target_path = arguments.path
         print(f"📂 Using path from argument: {target_path}")
     else:
         target_path = input("Enter target directory path: ")
@@ -339,7 +912,29 @@ if __name__ == "__main__":
     # Convert to absolute path
     target_path = os.path.abspath(target_path)
 
+    # A new plan would replace the journal of the interrupted one
+    journal = None
+
+    if not arguments.dry_run:
+        journal = RenameJournal()
+
+        if journal.is_interrupted():
+            print("❌ An interrupted rename is pending, use --resume or --rollback first")
+            journal.close()
+            sys.exit(1)
+
+    # Unchanged directories (same mtime since a clean run) are skipped
+    index = None if arguments.no_index else RenameIndex()
+
     # Process directory
-    rename_items_in_directory(target_path)
+    try:
+        failed = rename_items_in_directory(target_path, arguments.jobs, arguments.dry_run, journal, index)
+    finally:
+        if journal:
+            journal.close()
+
+        if index:
+            index.close()
 
     print("✨ All done!")
+    sys.exit(1 if failed else 0)
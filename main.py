@@ -2,66 +2,215 @@ import os
 import re
 import sys
 import time
-import html
-import yt_dlp
-import requests
+import glob
+import queue
+import shutil
+import hashlib
+import argparse
+import threading
+import tempfile
 import subprocess
 
-from Tool import convert_name
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # Windows: no update lock
+
+from contextlib         import contextmanager
+from urllib.parse       import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from Tool import convert_name, open_database, DATA_DIRECTORY, DIRECTORY_TEMP_PREFIX, DIRECTORY_PARTIAL
+
+
+
+###CONSTANTS###
+# Output policy: source codecs kept as-is (stream copy) and their extension, anything else is encoded to MP3
+OUTPUT_FORMATS = {
+    'mp3'   : {'mp3': '.mp3'},
+    'm4a'   : {'aac': '.m4a', 'mp3': '.mp3'},
+    'opus'  : {'opus': '.opus', 'mp3': '.mp3'},
+    'best'  : {'aac': '.m4a', 'opus': '.opus', 'vorbis': '.ogg', 'mp3': '.mp3'},
+}
+
+# Preferred audio stream for each output policy (more stream copies, fewer encodes)
+OUTPUT_FORMAT_SELECTORS = {
+    'mp3'   : 'bestaudio/best',
+    'm4a'   : 'bestaudio[ext=m4a]/bestaudio/best',
+    'opus'  : 'bestaudio[acodec=opus]/bestaudio/best',
+    'best'  : 'bestaudio/best',
+}
+
+# Seconds before the first retry round, doubled for every next round
+RETRY_DELAY = 10
+
+# Minimum time between two yt-dlp update checks
+UPDATE_CHECK_INTERVAL_HOURS = 24
+
+# Held exclusively by the background pip upgrade, yt-dlp is only imported once it is released
+FILE_UPDATE_LOCK    = os.path.join(DATA_DIRECTORY, 'update.lock')
+UPDATE_WAIT_TIMEOUT = 60    # Seconds, then the installed version is used anyway
+UPDATE_WAIT_POLL    = 0.5
 
 
 
 ###METHOD###
-def check_ytdlp_version():
-    print("🔄 Checking for yt-dlp package updates...")
+def check_ytdlp_version(interval_hours: float = UPDATE_CHECK_INTERVAL_HOURS) -> None:
+    # Skippable with YOUTUBE_MP3_NO_UPDATE=1 (scripts, offline use)
+    if os.environ.get('YOUTUBE_MP3_NO_UPDATE', '') not in ['', '0']:
+        return
+
+    # Run at most once per interval, the last check time is the mtime of a stamp file
+    file_stamp = os.path.join(DATA_DIRECTORY, 'update_check')
 
     try:
-        result = subprocess.run(
-            [sys.executable, '-m', 'pip', 'install', '--upgrade', 'yt-dlp'],
-            capture_output=True, text=True, timeout=60
-        )
+        last_check = os.path.getmtime(file_stamp)
+    except OSError:
+        last_check = 0
+
+    if time.time() - last_check < interval_hours * 3600:
+        return
+
+    print("🔄 Checking for yt-dlp package updates in the background...")
+
+    try:
+        os.makedirs(DATA_DIRECTORY, exist_ok=True)
+
+        with open(FILE_UPDATE_LOCK, 'a') as file_lock:
+            # Locked here and inherited by pip, so it stays held until the upgrade exits.
+            # Busy means another run is importing yt-dlp or already upgrading it, the next run checks again.
+            if fcntl:
+                try:
+                    fcntl.flock(file_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return
+
+            # Stamp first, so runs starting meanwhile do not launch another upgrade
+            with open(file_stamp, 'w'):
+                pass
+
+            # Loaded before pip starts rewriting it, so this run never waits for its own upgrade
+            try:
+                import yt_dlp
+            except ImportError:
+                pass
 
-    except subprocess.TimeoutExpired:
-        print("⏰ Update check timed out, continuing with current version...")
+            # Detached process: never blocks the download and survives the end of this run
+            subprocess.Popen(
+                [sys.executable, '-m', 'pip', 'install', '--upgrade', '--quiet', 'yt-dlp'],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                start_new_session=True, pass_fds=[file_lock.fileno()] if fcntl else []
+            )
 
     except Exception as e:
         print(f"⚠️ Could not check for yt-dlp updates: {e}")
 
 
 
-def get_video_title_from_url(video_url: str) -> str:
-    try:
-        # Set header for simulating a browser visit
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+def import_ytdlp():
+    """The yt_dlp module, imported once no upgrade is rewriting it (waits at most UPDATE_WAIT_TIMEOUT seconds)"""
+    if 'yt_dlp' in sys.modules:
+        return sys.modules['yt_dlp']
 
-        # Get request result
-        response = requests.get(video_url, headers=headers, timeout=10)
+    os.makedirs(DATA_DIRECTORY, exist_ok=True)
 
-        response.raise_for_status()
+    # Shared lock: a running upgrade is waited for, and no upgrade starts during the import
+    with open(FILE_UPDATE_LOCK, 'a') as file_lock:
+        deadline = time.monotonic() + UPDATE_WAIT_TIMEOUT
+        waiting  = False
 
-        # Extract title
-        title_match = re.search(r'<title[^>]*>([^<]+)</title>', response.text, re.IGNORECASE)
+        while fcntl:
+            try:
+                fcntl.flock(file_lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    print("⚠️ yt-dlp update still running, using the installed version")
+                    break
 
-        if not title_match:
-            print("⚠️ Could not extract title from page")
-            return False
+                if not waiting:
+                    print("⏳ Waiting for the yt-dlp update to finish...")
+                    waiting = True
 
-        title = title_match.group(1)
-        title = html.unescape(title)
-        title = re.sub(r'\s*-\s*YouTube\s*$', '', title)
+                time.sleep(UPDATE_WAIT_POLL)
 
-        return title.strip()
+        import yt_dlp
+
+    return yt_dlp
+
+
+
+def get_video_id(video_url: str) -> str:
+    parsed  = urlparse(video_url)
+    host    = parsed.hostname or ''
+
+    # Short links (youtu.be/<id>) and shorts (youtube.com/shorts/<id>) carry the ID in the path
+    if host.endswith('youtu.be'):
+        video_id = parsed.path.strip('/').split('/')[0]
+    elif parsed.path.startswith('/shorts/'):
+        video_id = parsed.path.split('/')[2]
+    else:
+        video_id = parse_qs(parsed.query).get('v', [''])[0]
+
+    # Fallback on a stable hash of the URL
+    if not re.match(r'^[\w-]+$', video_id):
+        video_id = hashlib.sha1(video_url.encode('utf-8')).hexdigest()[:16]
+
+    return video_id
+
+
+
+def get_directory_download() -> str:
+    user_home_directory = os.path.expanduser('~')
+
+    return f"{user_home_directory}/download/"
+
+
+
+def create_directory_temp() -> str:
+    # Per-run scratch directory, inside the download directory to keep os.replace atomic
+    directory_download = get_directory_download()
+    os.makedirs(directory_download, exist_ok=True)
+
+    return tempfile.mkdtemp(prefix=DIRECTORY_TEMP_PREFIX, dir=directory_download)
+
+
+
+def get_directory_partial() -> str:
+    # Partial downloads kept between runs to be resumed
+    return os.path.join(get_directory_download(), DIRECTORY_PARTIAL)
+
+
+
+def keep_partial_files(file_temp: str) -> None:
+    directory_partial = get_directory_partial()
+    os.makedirs(directory_partial, exist_ok=True)
+
+    # Keep the partial stream (<video_id>.<ext>.part) and its state, remove the rest
+    for temp_file in glob.glob(f"{glob.escape(file_temp)}.*"):
+        if temp_file.endswith(('.part', '.ytdl')):
+            os.replace(temp_file, os.path.join(directory_partial, os.path.basename(temp_file)))
+
+    clean_file_temp(file_temp)
+
+
+
+def restore_partial_files(file_temp: str) -> None:
+    # Claim the partial files of this video (os.replace, so only one run gets them)
+    directory_partial   = get_directory_partial()
+    video_id            = os.path.basename(file_temp)
+
+    for partial_file in glob.glob(os.path.join(glob.escape(directory_partial), f"{glob.escape(video_id)}.*")):
+        try:
+            os.replace(partial_file, os.path.join(os.path.dirname(file_temp), os.path.basename(partial_file)))
+        except FileNotFoundError:
+            pass
 
-    except Exception as error:
-        print(f"❌ Unexpected error extracting title: {str(error)}")
-        return False
 
 
 def clean_file_temp(file_temp: str) -> bool:
-    # Get list of temporary files to remove
-    temp_files = [file_temp, f"{file_temp}.mp3", f"{file_temp}.webm", f"{file_temp}.m4a"]
+    # Only remove the files of this job (<video_id> and <video_id>.<ext>)
+    temp_files = [file_temp] + glob.glob(f"{glob.escape(file_temp)}.*")
 
     # Remove temporary files
     for temp_file in temp_files:
@@ -72,38 +221,43 @@ def clean_file_temp(file_temp: str) -> bool:
 
 
 
-def download_audio_from_video(video_url, playlist_title = None) -> bool:
-    # Get (or create) download directory
-    user_home_directory = os.path.expanduser('~')
-    directory_download  = f"{user_home_directory}/download/"
-    file_temp           = os.path.join(directory_download, 'temp')
+def get_directory_to_save(playlist_title: str = None) -> str:
+    directory_download  = get_directory_download()
+    directory_to_save   = directory_download
 
-    # Get and convert title
-    title = get_video_title_from_url(video_url)
+    if(playlist_title):
+        directory_to_save = f"{directory_download}{playlist_title}/"
 
-    if title == False:
-        print("❌ Could not determine video title, skipping download!")
-        return False
+        # Several workers may create the playlist directory at the same time
+        os.makedirs(directory_to_save, exist_ok=True)
 
+    return directory_to_save
+
+
+
+def get_file_to_save(title: str, playlist_title: str = None) -> str:
+    # Convert title
     title_converted = convert_name(title)
     file            = f"{title_converted}.mp3"
 
     # Create directory and file name
-    directory_to_save = directory_download
+    return os.path.join(get_directory_to_save(playlist_title), file)
 
-    if(playlist_title):
-        directory_to_save = f"{directory_download}{playlist_title}/"
 
-        if not os.path.exists(directory_to_save):
-            os.makedirs(directory_to_save)
 
-    file_to_save = os.path.join(directory_to_save, file)
+def find_existing_file(file_to_save: str, audio_format: str) -> str:
+    # The final extension depends on the source codec, check every one the policy can produce
+    file_base = os.path.splitext(file_to_save)[0]
+
+    for ext in OUTPUT_FORMATS[audio_format].values():
+        if os.path.exists(file_base + ext):
+            return file_base + ext
+
+    return None
+
 
-    # Skip it when file already exists
-    if os.path.exists(file_to_save):
-        print(f"⏭️  File {file} already exists.")
-        return True
 
+def get_ydl_options(directory_temp: str, audio_format: str = 'mp3') -> dict:
     # Create headers and options for yt-dlp
     ydl_headers = {
         'User-Agent'       : 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -115,16 +269,16 @@ def download_audio_from_video(video_url, playlist_title = None) -> bool:
         'Connection'       : 'keep-alive',
     }
 
-    ydl_opts = {
-        'outtmpl'                   : file_temp,
+    # Temporary files are keyed by video ID, so one set of options fits every video of the run
+    return {
+        'format'                    : OUTPUT_FORMAT_SELECTORS[audio_format],
+        'outtmpl'                   : os.path.join(directory_temp, '%(id)s.%(ext)s'),
         'http_headers'              : ydl_headers,
         'retry_sleep_functions'     : {'http': lambda x: min(2 ** x, 10)},
         'retries'                   : 3,
         'fragment_retries'          : 3,
+        'continuedl'                : True,
         'socket_timeout'            : 30,
-        'sleep_interval'            : 1,
-        'max_sleep_interval'        : 5,
-        'sleep_interval_requests'   : 1,
         'extract_flat'              : False,
         'writethumbnail'            : False,
         'writeinfojson'             : False,
@@ -135,93 +289,802 @@ def download_audio_from_video(video_url, playlist_title = None) -> bool:
         'no_color'                  : True,
         'noprogress'                : True,
         'logger'                    : None,
-        'postprocessors'            : [{
-            'key'               : 'FFmpegExtractAudio',
-            'preferredcodec'    : 'mp3',
-            'preferredquality'  : '192',
-        }],
     }
 
-    # Download the audio
-    print(f"📥 Starting download: {file}")
-    ydl = yt_dlp.YoutubeDL(ydl_opts)
+
+
+def get_file_checksum(file_path: str) -> str:
+    checksum = hashlib.sha256()
+
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            checksum.update(chunk)
+
+    return checksum.hexdigest()
+
+
+
+class DownloadArchive:
+    """On-disk index of downloaded videos keyed by YouTube video ID and target directory (one copy per playlist folder)"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS archive_file (
+            video_id    TEXT NOT NULL,
+            directory   TEXT NOT NULL,
+            path        TEXT NOT NULL,
+            size        INTEGER NOT NULL,
+            checksum    TEXT NOT NULL,
+            created_at  REAL NOT NULL,
+            PRIMARY KEY (video_id, directory)
+        );
+    """
+
+    def __init__(self, name: str = 'archive.db'):
+        self.connection = open_database(name, self.SCHEMA)
+        self.lock       = threading.Lock()
+
+        self.migrate()
+
+    def migrate(self) -> None:
+        # Archives keyed by video ID only: each path is moved under its directory
+        if not self.connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'archive'").fetchone():
+            return
+
+        rows = self.connection.execute('SELECT video_id, path, size, checksum, created_at FROM archive').fetchall()
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO archive_file (video_id, directory, path, size, checksum, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(video_id, os.path.dirname(path), path, size, checksum, created_at) for video_id, path, size, checksum, created_at in rows]
+            )
+            self.connection.execute('DROP TABLE archive')
+
+    def contains(self, video_id: str, directory: str) -> bool:
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT 1 FROM archive_file WHERE video_id = ? AND directory = ?', (video_id, os.path.abspath(directory))
+            ).fetchone()
+
+        return row is not None
+
+    def add(self, video_id: str, file_path: str) -> None:
+        file_path   = os.path.abspath(file_path)
+        size        = os.path.getsize(file_path)
+        checksum    = get_file_checksum(file_path)
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO archive_file (video_id, directory, path, size, checksum, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (video_id, os.path.dirname(file_path), file_path, size, checksum, time.time())
+            )
+
+    def get_path(self, video_id: str, directory: str) -> str:
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT path FROM archive_file WHERE video_id = ? AND directory = ?', (video_id, os.path.abspath(directory))
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def remove(self, video_id: str, directory: str) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                'DELETE FROM archive_file WHERE video_id = ? AND directory = ?', (video_id, os.path.abspath(directory))
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+
+class PlaylistState:
+    """Last-seen (and downloaded) entries of each synced playlist"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS playlist_entry (
+            playlist_id TEXT NOT NULL,
+            video_id    TEXT NOT NULL,
+            title       TEXT,
+            directory   TEXT,
+            PRIMARY KEY (playlist_id, video_id)
+        );
+    """
+
+    def __init__(self, name: str = 'playlists.db'):
+        self.connection = open_database(name, self.SCHEMA)
+        self.migrate()
+
+    def migrate(self) -> None:
+        # States saved before the directory column: unknown directory (NULL) until the next sync of their playlist
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(playlist_entry)')]
+
+        if 'directory' not in columns:
+            with self.connection:
+                self.connection.execute('ALTER TABLE playlist_entry ADD COLUMN directory TEXT')
+
+    def get_entries(self, playlist_id: str) -> dict:
+        rows = self.connection.execute('SELECT video_id, title FROM playlist_entry WHERE playlist_id = ?', (playlist_id,))
+
+        return dict(rows.fetchall())
+
+    def is_referenced(self, video_id: str, playlist_id: str, directory: str) -> bool:
+        """Whether another synced playlist saving into the same directory still contains the video"""
+        # Playlists saving elsewhere have their own copy, an unknown directory counts as the same one
+        row = self.connection.execute(
+            'SELECT 1 FROM playlist_entry WHERE video_id = ? AND playlist_id != ? AND (directory = ? OR directory IS NULL) LIMIT 1',
+            (video_id, playlist_id, os.path.abspath(directory))
+        ).fetchone()
+
+        return row is not None
+
+    def save_entries(self, playlist_id: str, entries: dict, directory: str) -> None:
+        with self.connection:
+            self.connection.execute('DELETE FROM playlist_entry WHERE playlist_id = ?', (playlist_id,))
+            self.connection.executemany(
+                'INSERT INTO playlist_entry (playlist_id, video_id, title, directory) VALUES (?, ?, ?, ?)',
+                [(playlist_id, video_id, title, os.path.abspath(directory)) for video_id, title in entries.items()]
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+
+class RetryQueue:
+    """Failed downloads waiting for a new attempt (kept between runs)"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS retry (
+            video_id        TEXT PRIMARY KEY,
+            url             TEXT NOT NULL,
+            title           TEXT,
+            playlist_title  TEXT,
+            attempts        INTEGER NOT NULL,
+            updated_at      REAL NOT NULL
+        );
+    """
+
+    def __init__(self, name: str = 'retry.db'):
+        self.connection = open_database(name, self.SCHEMA)
+        self.lock       = threading.Lock()
+
+    def add(self, video_id: str, entry: dict, playlist_title: str = None) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                """
+                    INSERT INTO retry (video_id, url, title, playlist_title, attempts, updated_at) VALUES (?, ?, ?, ?, 1, ?)
+                    ON CONFLICT (video_id) DO UPDATE SET attempts = attempts + 1, updated_at = excluded.updated_at
+                """,
+                (video_id, entry['url'], entry.get('title'), playlist_title, time.time())
+            )
+
+    def remove(self, video_ids: list) -> None:
+        with self.lock, self.connection:
+            self.connection.executemany('DELETE FROM retry WHERE video_id = ?', [(video_id,) for video_id in video_ids])
+
+    def get_entries(self) -> list:
+        with self.lock:
+            rows = self.connection.execute('SELECT video_id, url, title, playlist_title, attempts FROM retry ORDER BY updated_at').fetchall()
+
+        return [
+            {'id': video_id, 'url': url, 'title': title, 'playlist_title': playlist_title, 'attempts': attempts}
+            for video_id, url, title, playlist_title, attempts in rows
+        ]
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+
+class RateLimiter:
+    """Token bucket shared by the download workers, its rate adapts to YouTube throttling"""
+
+    def __init__(self, rate: float = 2.0, max_rate: float = 5.0, min_rate: float = 0.05, burst: int = 3):
+        self.rate           = min(rate, max_rate)
+        self.max_rate       = max_rate
+        self.min_rate       = min_rate
+        self.burst          = burst
+        self.tokens         = float(burst)
+        self.updated        = time.monotonic()
+        self.paused_until   = 0.0
+        self.backoff        = 0.0
+        self.latency        = None
+        self.lock           = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now             = time.monotonic()
+                self.tokens     = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated    = now
+
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+
+            time.sleep(wait)
+
+    def success(self, latency: float) -> None:
+        with self.lock:
+            self.backoff = 0.0
+
+            # Much slower answers than usual are an early sign of throttling
+            if self.latency and latency > self.latency * 3:
+                self.rate = max(self.min_rate, self.rate * 0.8)
+            else:
+                self.rate = min(self.max_rate, self.rate + 0.1)
+
+            # Moving average of the latency
+            self.latency = latency if self.latency is None else self.latency * 0.8 + latency * 0.2
+
+    def throttled(self) -> None:
+        with self.lock:
+            # Halve the rate and pause every worker, the pause doubles while throttling goes on
+            self.rate           = max(self.min_rate, self.rate / 2)
+            self.backoff        = min(300.0, self.backoff * 2 or 5.0)
+            self.paused_until   = time.monotonic() + self.backoff
+            self.tokens         = 0.0
+
+        print(f"🐢 Throttled by YouTube, pausing {self.backoff:.0f}s then {self.rate:.2f} request(s)/s")
+
+
+
+def is_throttling_error(error: Exception) -> bool:
+    return re.search(r'HTTP Error (429|403)|Too Many Requests|confirm you.re not a bot', str(error), re.IGNORECASE) is not None
+
+
+
+class DownloadContext:
+    """Run-scoped state shared by every download: scratch directory, archive, rate limiter and reusable YoutubeDL instances"""
+
+    def __init__(self, use_archive: bool = True, audio_format: str = 'mp3', max_rate: float = 5.0, retries: int = 2):
+        self.limiter        = RateLimiter(max_rate=max_rate)
+        self.retries        = retries
+        self.retry_queue    = RetryQueue()
+        self.audio_format   = audio_format
+        self.directory_temp = create_directory_temp()
+        self.ydl_options    = get_ydl_options(self.directory_temp, audio_format)
+        self.ydl_pool       = queue.Queue()
+        self.archive        = DownloadArchive() if use_archive else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextmanager
+    def get_ydl(self):
+        # Reuse an idle instance (keeps extractors, cookies and HTTP connections alive),
+        # a new one is only built when every instance is busy, so at most one per worker
+        try:
+            ydl = self.ydl_pool.get_nowait()
+        except queue.Empty:
+            # Imported on first use, so --help or an invalid URL never pay for it
+            yt_dlp  = import_ytdlp()
+            ydl     = yt_dlp.YoutubeDL(self.ydl_options)
+
+        try:
+            yield ydl
+        finally:
+            self.ydl_pool.put(ydl)
+
+    def close(self) -> None:
+        while not self.ydl_pool.empty():
+            self.ydl_pool.get_nowait().close()
+
+        if self.archive:
+            self.archive.close()
+
+        self.retry_queue.close()
+
+        shutil.rmtree(self.directory_temp, ignore_errors=True)
+
+
+
+def archive_download(context: DownloadContext, video_id: str, file_path: str) -> None:
+    if not context.archive:
+        return
+
+    try:
+        context.archive.add(video_id, file_path)
+    except Exception as error:
+        print(f"⚠️ Could not update download archive: {error}")
+
+
+
+def fetch_audio(video_url, playlist_title: str, title: str, context: DownloadContext):
+    """Download the raw audio stream, return an encode job (dict), or True when skipped and False on error"""
+    video_id    = get_video_id(video_url)
+    file_temp   = os.path.join(context.directory_temp, video_id)
+
+    # Skip it when the video is in the archive for this folder (no network needed, survives renames),
+    # every playlist folder gets its own copy
+    if context.archive and context.archive.contains(video_id, get_directory_to_save(playlist_title)):
+        print(f"⏭️  Video {video_id} already downloaded (archive).")
+        return True
+
+    # Skip it when file already exists (title known from the playlist, no network needed)
+    if title:
+        file_existing = find_existing_file(get_file_to_save(title, playlist_title), context.audio_format)
+
+        if file_existing:
+            print(f"⏭️  File {os.path.basename(file_existing)} already exists.")
+            archive_download(context, video_id, file_existing)
+            return True
+
+    # Resume a previous partial download of this video
+    restore_partial_files(file_temp)
 
     try:
-        ydl.download([video_url])
+        with context.get_ydl() as ydl:
+            # Get video metadata once (title and formats), it is reused for the download
+            context.limiter.acquire()
+            started = time.monotonic()
+            info    = ydl.extract_info(video_url, download=False)
+            context.limiter.success(time.monotonic() - started)
+
+            if not info or not info.get('title'):
+                print("❌ Could not determine video title, skipping download!")
+                return False
+
+            file_temp       = os.path.join(context.directory_temp, info['id'])
+            file_to_save    = get_file_to_save(info['title'], playlist_title)
+            file            = os.path.basename(file_to_save)
+            file_existing   = find_existing_file(file_to_save, context.audio_format)
+
+            # Skip it when file already exists
+            if file_existing:
+                print(f"⏭️  File {os.path.basename(file_existing)} already exists.")
+                archive_download(context, info['id'], file_existing)
+                return True
+
+            # Download the audio (no second page fetch, the extracted info is processed directly)
+            print(f"📥 Starting download: {file}")
+            context.limiter.acquire()
+            ydl.process_ie_result(info, download=True)
 
     except Exception as error_result:
-        # Wait and clean temporary files when YouTube returns an error
+        # Slow every worker down when YouTube throttles, then clean temporary files
         print(f"❌ Unexpected error: {str(error_result)}")
-        time.sleep(5)
+
+        if is_throttling_error(error_result):
+            context.limiter.throttled()
+
+        # Downloaded bytes are kept, the next attempt resumes them (HTTP range request)
+        keep_partial_files(file_temp)
+
+        return False
+
+    # Find the downloaded stream (<video_id>.webm, <video_id>.m4a, ...)
+    sources = [
+        path for path in glob.glob(f"{glob.escape(file_temp)}.*")
+        if not path.endswith(('.part', '.ytdl')) and '.output.' not in path and os.path.getsize(path) > 0
+    ]
+
+    if not sources:
         clean_file_temp(file_temp)
 
+        print(f"❌ Bad or temporary file empty!")
         return False
 
-    # Clean temporary file
-    temp_mp3_file = f"{file_temp}.mp3"
+    return {
+        'video_id'      : info['id'],
+        'file_temp'     : file_temp,
+        'file_source'   : sources[0],
+        'file_to_save'  : file_to_save,
+        'codec'         : get_codec_name(info.get('acodec'), sources[0]),
+    }
+
+
+
+def get_codec_name(acodec: str, file_source: str) -> str:
+    acodec = (acodec or '').lower()
+
+    # yt-dlp reports AAC as 'mp4a.40.2'
+    if acodec.startswith('mp4a') or acodec == 'aac':
+        return 'aac'
+
+    if acodec in ['opus', 'vorbis', 'mp3']:
+        return acodec
+
+    # Unknown codec, guess it from the container
+    return {'.m4a': 'aac', '.webm': 'opus', '.opus': 'opus', '.ogg': 'vorbis', '.mp3': 'mp3'}.get(
+        os.path.splitext(file_source)[1].lower()
+    )
+
+
+
+def encode_audio(job: dict, context: DownloadContext) -> bool:
+    """Remux the fetched stream when the output policy accepts its codec, encode it to MP3 otherwise"""
+    file_temp   = job['file_temp']
+    ext         = OUTPUT_FORMATS[context.audio_format].get(job['codec'])
+
+    if ext:
+        # Stream copy: no re-encode, only the container changes
+        codec_options = ['-codec:a', 'copy']
+    else:
+        ext             = '.mp3'
+        codec_options   = ['-codec:a', 'libmp3lame', '-b:a', '192k']
+
+    temp_output_file    = f"{file_temp}.output{ext}"
+    file_to_save        = os.path.splitext(job['file_to_save'])[0] + ext
+    file                = os.path.basename(file_to_save)
+
+    try:
+        subprocess.run(
+            ['ffmpeg', '-y', '-nostdin', '-v', 'error', '-i', job['file_source'], '-vn'] + codec_options + [temp_output_file],
+            capture_output=True, text=True, check=True
+        )
+
+    except subprocess.CalledProcessError as error:
+        print(f"❌ Encoding failed for {file}: {error.stderr.strip()}")
+        clean_file_temp(file_temp)
+        return False
 
-    if not (os.path.exists(temp_mp3_file) and os.path.getsize(temp_mp3_file) > 0):
-        for temp_file in [file_temp, temp_mp3_file]:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+    except FileNotFoundError:
+        print(f"❌ ffmpeg not found, cannot encode {file}")
+        clean_file_temp(file_temp)
+        return False
+
+    # Clean temporary file
+    if not (os.path.exists(temp_output_file) and os.path.getsize(temp_output_file) > 0):
+        clean_file_temp(file_temp)
 
         print(f"❌ Bad or temporary file empty!")
         return False
 
-    # Move tempory file to final file
-    os.rename(temp_mp3_file, file_to_save)
+    # Move tempory file to final file (atomic, never a half-written file)
+    os.replace(temp_output_file, file_to_save)
+    clean_file_temp(file_temp)
+    archive_download(context, job['video_id'], file_to_save)
     print(f"✅ {file} Downloaded successfully.")
 
     return True
 
 
 
+def download_audio_from_video(video_url, playlist_title = None, title: str = None, context: DownloadContext = None) -> bool:
+    # Use a private context when the caller did not provide one
+    if context is None:
+        with DownloadContext() as context:
+            return download_audio_from_video(video_url, playlist_title, title, context)
+
+    job = fetch_audio(video_url, playlist_title, title, context)
+
+    if not isinstance(job, dict):
+        return job
+
+    return encode_audio(job, context)
+
+
+
+def get_entry_id(entry: dict) -> str:
+    return entry.get('id') or get_video_id(entry['url'])
+
+
+
+def run_download_pipeline(jobs_list: list, total: int, playlist_title: str, context: DownloadContext, jobs: int, encode_jobs: int) -> list:
+    """Run (index, entry) pairs through a fetch pool and an encode pool, return the failed pairs"""
+    failures    = []
+    done        = 0
+    lock        = threading.Lock()
+
+    # Bounded queue between the stages: fetchers wait when the encoders are behind
+    encode_queue = queue.Queue(maxsize=encode_jobs * 2)
+
+    def record(index: int, entry: dict, success: bool) -> None:
+        nonlocal done
+
+        with lock:
+            done += 1
+
+            if success:
+                print(f"📊 [{done}/{len(jobs_list)}] Track {index} done")
+            else:
+                failures.append((index, entry))
+                print(f"📊 [{done}/{len(jobs_list)}] Track {index} failed")
+
+    def fetch_job(index: int, entry: dict) -> None:
+        video_url = entry['url']
+        print(f"▶️  [{index}/{total}] Starting: {video_url}")
+
+        # The flat playlist entry already carries the title, no need to fetch it again
+        try:
+            job = fetch_audio(video_url, playlist_title, entry.get('title'), context)
+        except Exception as error:
+            print(f"❌ [{index}/{total}] Unexpected error: {str(error)}")
+            job = False
+
+        if isinstance(job, dict):
+            encode_queue.put((index, entry, job))
+        else:
+            record(index, entry, job)
+
+    def encode_worker() -> None:
+        while True:
+            item = encode_queue.get()
+
+            if item is None:
+                break
+
+            index, entry, job = item
+
+            try:
+                success = encode_audio(job, context)
+            except Exception as error:
+                print(f"❌ [{index}/{total}] Unexpected error: {str(error)}")
+                success = False
+
+            record(index, entry, success)
+
+    encoders = [threading.Thread(target=encode_worker, daemon=True) for _ in range(encode_jobs)]
+
+    for encoder in encoders:
+        encoder.start()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for index, entry in jobs_list:
+            executor.submit(fetch_job, index, entry)
+
+    # Every stream is fetched, stop the encoders once the queue is drained
+    for encoder in encoders:
+        encode_queue.put(None)
+
+    for encoder in encoders:
+        encoder.join()
+
+    return failures
+
+
+
+def download_playlist(entries: list, playlist_title: str, context: DownloadContext, jobs: int = 1, encode_jobs: int = None) -> list:
+    """Download playlist entries (retrying failures at the end of the run) and return the failed entries"""
+    total       = len(entries)
+    encode_jobs = encode_jobs or os.cpu_count() or 1
+
+    print(f"🎶 {total} video(s) to download with {jobs} download worker(s) and {encode_jobs} encode worker(s)")
+
+    failures = run_download_pipeline(list(enumerate(entries, 1)), total, playlist_title, context, jobs, encode_jobs)
+
+    # Retry failed entries with exponential backoff, their partial downloads are resumed
+    for attempt in range(1, context.retries + 1):
+        if not failures:
+            break
+
+        delay = RETRY_DELAY * 2 ** (attempt - 1)
+        print(f"\n🔁 Retry {attempt}/{context.retries}: {len(failures)} failed track(s), waiting {delay}s")
+        time.sleep(delay)
+
+        failures = run_download_pipeline(sorted(failures, key=lambda failure: failure[0]), total, playlist_title, context, jobs, encode_jobs)
+
+    # Keep the persistent retry queue up to date
+    failed_ids = {get_entry_id(entry) for _, entry in failures}
+
+    context.retry_queue.remove([get_entry_id(entry) for entry in entries if get_entry_id(entry) not in failed_ids])
+
+    for _, entry in failures:
+        context.retry_queue.add(get_entry_id(entry), entry, playlist_title)
+
+    # Display summary
+    print(f"\n📋 Playlist summary: {total - len(failures)} succeeded, {len(failures)} failed")
+
+    for index, entry in sorted(failures, key=lambda failure: failure[0]):
+        print(f"   ❌ [{index}] {entry.get('title') or entry['url']}")
+
+    if failures:
+        print(f"💡 Failed tracks are queued, run 'python main.py --retry-failed' to try them again")
+
+    return [entry for _, entry in failures]
+
+
+
+def retry_failed_downloads(context: DownloadContext, jobs: int = 1, encode_jobs: int = None) -> list:
+    """Download the entries of the persistent retry queue and return the ones still failing"""
+    entries = context.retry_queue.get_entries()
+
+    if not entries:
+        print("✨ Retry queue is empty. Nothing to do!")
+        return []
+
+    # Entries keep the playlist they were downloaded for
+    playlists = {}
+
+    for entry in entries:
+        playlists.setdefault(entry['playlist_title'], []).append(entry)
+
+    failures = []
+
+    for playlist_title, playlist_entries in playlists.items():
+        print(f"\n🔁 Retrying {len(playlist_entries)} track(s) of {playlist_title or 'standalone downloads'}")
+        failures += download_playlist(playlist_entries, playlist_title, context, jobs, encode_jobs)
+
+    return failures
+
+
+
+def sync_playlist(playlist_dict: dict, playlist_title: str, context: DownloadContext, jobs: int = 1, remove_dropped: bool = False, encode_jobs: int = None) -> list:
+    """Download only the entries added since the last sync and return the failed entries"""
+    playlist_id         = playlist_dict.get('id') or playlist_title
+    entries             = {get_entry_id(entry): entry for entry in playlist_dict['entries'] if entry}
+    directory_to_save   = get_directory_to_save(playlist_title)
+    state               = PlaylistState()
+
+    try:
+        # Diff the current playlist against the last-seen entries
+        seen    = state.get_entries(playlist_id)
+        added   = [entry for video_id, entry in entries.items() if video_id not in seen]
+        dropped = {video_id: title for video_id, title in seen.items() if video_id not in entries}
+
+        print(f"🔄 Sync: {len(added)} new, {len(dropped)} dropped, {len(entries) - len(added)} unchanged")
+
+        # Report (or remove) tracks that left the playlist
+        for video_id, title in dropped.items():
+            print(f"   ➖ Dropped from playlist: {title or video_id}")
+
+            if not remove_dropped:
+                continue
+
+            # Another synced playlist saving into the same folder relies on this file, it is kept then
+            if state.is_referenced(video_id, playlist_id, directory_to_save):
+                print(f"      ⏭️  Kept: still in another synced playlist of this folder")
+                continue
+
+            remove_downloaded_track(context, video_id, directory_to_save)
+
+        failures = download_playlist(added, playlist_title, context, jobs, encode_jobs) if added else []
+
+        # Failed entries are not recorded, so they are retried by the next sync
+        failed_ids = {get_entry_id(entry) for entry in failures}
+        state.save_entries(playlist_id, {
+            video_id: entry.get('title')
+            for video_id, entry in entries.items() if video_id not in failed_ids
+        }, directory_to_save)
+
+    finally:
+        state.close()
+
+    return failures
+
+
+
+def remove_downloaded_track(context: DownloadContext, video_id: str, directory_to_save: str) -> None:
+    # Only the copy of this playlist folder
+    file_path = context.archive.get_path(video_id, directory_to_save) if context.archive else None
+
+    if not file_path:
+        print(f"      ⚠️ {video_id} is not in the download archive, cannot locate its file")
+        return
+
+    if os.path.exists(file_path):
+        os.remove(file_path)
+        print(f"      🗑️  Removed: {file_path}")
+
+    context.archive.remove(video_id, directory_to_save)
+
+
+
+def extract_playlist(url: str) -> tuple:
+    # Options
+    ydl_opts = {
+        'extract_flat'  : True, # Only extract metadata
+        'skip_download' : True, # Not for the moment
+        'quiet'         : True, # Suppress most output
+        'no_warnings'   : True, # No warnings
+        'no_color'      : True, # Remove colors
+        'noprogress'    : True, # Remove progress bars
+    }
+
+    # Get playlist details and parse it
+    yt_dlp = import_ytdlp()
+
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        playlist_dict   = ydl.extract_info(url, download=False)
+        playlist_title  = convert_name(playlist_dict.get('title', ''))
+
+    return playlist_dict, playlist_title
+
+
+
+def is_youtube_url(url: str) -> bool:
+    return "youtube.com" in url or "youtu.be" in url
+
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Convert YouTube videos or playlists into MP3 files")
+    parser.add_argument('url', nargs='?', help="YouTube video or playlist URL (prompted when missing)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Number of playlist downloads to run in parallel (default: 1)")
+    parser.add_argument('--encode-jobs', type=int, default=None, help="Number of parallel MP3 encodes (default: number of CPU cores)")
+    parser.add_argument('--format', dest='audio_format', choices=sorted(OUTPUT_FORMATS), default='mp3', help="Output policy: keep the source stream when its codec fits (m4a, opus, best), MP3 otherwise (default: mp3)")
+    parser.add_argument('--max-rate', type=float, default=5.0, help="Maximum YouTube requests per second, lowered automatically when throttled (default: 5)")
+    parser.add_argument('--retries', type=int, default=2, help="Retry rounds for failed tracks at the end of the run, with exponential backoff (default: 2)")
+    parser.add_argument('--retry-failed', action='store_true', help="Download the tracks that failed in previous runs (no URL needed)")
+    parser.add_argument('--no-update-check', action='store_true', help="Do not check for yt-dlp updates (or set YOUTUBE_MP3_NO_UPDATE=1)")
+    parser.add_argument('--update-interval', type=float, default=UPDATE_CHECK_INTERVAL_HOURS, help="Hours between two yt-dlp update checks (default: 24)")
+    parser.add_argument('--no-archive', action='store_true', help="Ignore the download archive (skip only on existing files)")
+    parser.add_argument('--sync', action='store_true', help="Playlist: only download entries added since the last sync")
+    parser.add_argument('--remove-dropped', action='store_true', help="With --sync: delete the files of entries removed from the playlist")
+
+    arguments = parser.parse_args()
+
+    if arguments.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    if arguments.encode_jobs is not None and arguments.encode_jobs < 1:
+        parser.error("--encode-jobs must be at least 1")
+
+    if arguments.retries < 0:
+        parser.error("--retries cannot be negative")
+
+    if arguments.max_rate <= 0:
+        parser.error("--max-rate must be positive")
+
+    if arguments.remove_dropped and not arguments.sync:
+        parser.error("--remove-dropped requires --sync")
+
+    return arguments
+
+
+
 ###MAIN###
 if __name__ == "__main__":
+    arguments = parse_arguments()
+
     # Check yt-dlp updates (Youtube compatibility or restrictions)
-    check_ytdlp_version()
+    if not arguments.no_update_check:
+        check_ytdlp_version(arguments.update_interval)
+
+    # Retry the downloads that failed in previous runs
+    if arguments.retry_failed:
+        with DownloadContext(not arguments.no_archive, arguments.audio_format, arguments.max_rate, arguments.retries) as context:
+            failures = retry_failed_downloads(context, arguments.jobs, arguments.encode_jobs)
+
+        print("✅ Retry task terminated!")
+        sys.exit(1 if failures else 0)
 
     # Get URL to use by argument or input
-    if len(sys.argv) > 1:
-        url = sys.argv[1]
+    if arguments.url:
+        url = arguments.url
         print(f"🔗 Using URL from argument: {url}")
     else:
         url = input("Enter a YouTube URL: ")
 
     # Check if the URL is valid (Youtube)
-    if "youtube.com" not in url and "youtu.be" not in url:
+    if not is_youtube_url(url):
         print("❌ Invalid YouTube URL!")
-        print("💡 Usage: python main.py <youtube_url>")
+        print("💡 Usage: python main.py [--jobs N] <youtube_url>")
         print("💡 Example (argument): python main.py 'https://www.youtube.com/watch?v=xxxxx'")
         print("💡 Example (prompt): python main.py")
-        exit()
+        sys.exit(2)
 
     # For Playlist
     if "playlist" in url:
-        # Options
-        ydl_opts = {
-            'extract_flat'  : True, # Only extract metadata
-            'skip_download' : True, # Not for the moment
-            'quiet'         : True, # Suppress most output
-            'no_warnings'   : True, # No warnings
-            'no_color'      : True, # Remove colors
-            'noprogress'    : True, # Remove progress bars
-        }
-
-        # Get playlist details and parse it
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            playlist_dict   = ydl.extract_info(url, download=False)
-            playlist_title  = convert_name(playlist_dict.get('title', ''))
-
-            # Download each video
-            for i, entry in enumerate(playlist_dict['entries'], 1):
-                video_url = entry['url']
-
-                download_audio_from_video(video_url, playlist_title)
+        playlist_dict, playlist_title = extract_playlist(url)
+
+        # Download each video (one context, its YoutubeDL instances are reused by every entry)
+        entries = [entry for entry in playlist_dict['entries'] if entry]
+
+        with DownloadContext(not arguments.no_archive, arguments.audio_format, arguments.max_rate, arguments.retries) as context:
+            if arguments.sync:
+                failures = sync_playlist(playlist_dict, playlist_title, context, arguments.jobs, arguments.remove_dropped, arguments.encode_jobs)
+            else:
+                failures = download_playlist(entries, playlist_title, context, arguments.jobs, arguments.encode_jobs)
 
         print("✅ Playlist task terminated!")
-        exit()
+        sys.exit(1 if failures else 0)
 
     # Download a standalone file
-    download_audio_from_video(url)
+    with DownloadContext(not arguments.no_archive, arguments.audio_format, arguments.max_rate, arguments.retries) as context:
+        success = download_audio_from_video(url, context=context)
+
+        if success:
+            context.retry_queue.remove([get_video_id(url)])
+        else:
+            context.retry_queue.add(get_video_id(url), {'url': url})
+            print(f"💡 Failed track is queued, run 'python main.py --retry-failed' to try it again")
+
     print("✅ Standalone task terminated!")
+    sys.exit(0 if success else 1)
@@ -1,26 +1,189 @@
 import os
 import sys
+import json
+import argparse
+import importlib
 
 from collections        import Counter
+from concurrent.futures import ThreadPoolExecutor
 
-from mutagen.easyid3    import EasyID3
-from mutagen.id3        import ID3NoHeaderError, ID3
-from mutagen.flac       import FLAC
-from mutagen.mp4        import MP4
-from mutagen.oggvorbis  import OggVorbis
-from mutagen.wave       import WAVE
-
-from Tool               import convert_name, AUDIO_EXTENSIONS
+from Tool               import convert_name, walk_library, PathIndex, AUDIO_EXTENSIONS
 
 
 
 ###CONSTANTS###
 VALID_GENRES = ["Book", "Game", "Kid", "Movie", "Other", "Pop", "Rap", "Rock", "Tango", "Web"]
 
+# Tag format -> mutagen class (module, name), imported only for the formats actually seen
+# 'id3' covers MPEG audio (.mp3) and raw AAC (.aac), both tagged with an ID3 header
+AUDIO_FORMATS = {
+    'id3'   : ('mutagen.easyid3',   'EasyID3'),
+    'flac'  : ('mutagen.flac',      'FLAC'),
+    'mp4'   : ('mutagen.mp4',       'MP4'),
+    'ogg'   : ('mutagen.oggvorbis', 'OggVorbis'),
+    'opus'  : ('mutagen.oggopus',   'OggOpus'),
+    'wav'   : ('mutagen.wave',      'WAVE'),
+    'wma'   : ('mutagen.asf',       'ASF'),
+}
+
+# Tag format of each extension, used when the header is not recognized
+EXTENSION_FORMATS = {
+    '.mp3'  : 'id3',
+    '.aac'  : 'id3',
+    '.flac' : 'flac',
+    '.m4a'  : 'mp4',
+    '.mp4'  : 'mp4',
+    '.ogg'  : 'ogg',
+    '.opus' : 'opus',
+    '.wav'  : 'wav',
+    '.wma'  : 'wma',
+}
+
+# Tag names of the formats not using 'artist', 'album' and 'genre' (WAV holds ID3 frames)
+TAG_KEYS = {
+    'mp4'   : {'artist': '\xa9ART', 'album': '\xa9alb',       'genre': '\xa9gen'},
+    'wma'   : {'artist': 'Author',  'album': 'WM/AlbumTitle', 'genre': 'WM/Genre'},
+    'wav'   : {'artist': 'TPE1',    'album': 'TALB',          'genre': 'TCON'},
+}
+
+# Padding reserved when the tags do not fit anymore, so later edits are written in place
+TAG_PADDING = 4096
+
+# First bytes of an ASF (WMA) header object
+ASF_SIGNATURE = bytes.fromhex('3026b2758e66cf11a6d900aa0062ce6c')
+
+# Files read or written in parallel (tag I/O waits on the disk, not on the CPU)
+TAG_JOBS = 8
+
+# Batch mode: values it cannot infer are written there, filled values are read back on the next run
+ANSWERS_FILE = 'tag_answers.json'
+
 
 
 ###METHOD###
-def get_audio_tags(file_path: str) -> dict:
+def sniff_audio_format(file_handle, ext: str) -> str:
+    """Tag format of an open file from its first bytes (mislabelled extensions included), None when unknown"""
+    header = file_handle.read(64)
+    file_handle.seek(0)
+
+    if header.startswith(b'fLaC'):
+        return 'flac'
+
+    if header[4:8] == b'ftyp':
+        return 'mp4'
+
+    if header.startswith(b'OggS'):
+        # The codec is named in the first packet of the stream
+        if b'OpusHead' in header:
+            return 'opus'
+        if b'\x01vorbis' in header:
+            return 'ogg'
+        return None
+
+    if header.startswith(b'RIFF') and header[8:12] == b'WAVE':
+        return 'wav'
+
+    if header.startswith(ASF_SIGNATURE):
+        return 'wma'
+
+    # ID3 header (FLAC files may have one in front of their own tags)
+    if header.startswith(b'ID3'):
+        return 'flac' if ext == '.flac' else 'id3'
+
+    # MPEG audio or ADTS (AAC) frame sync, without tags yet
+    if len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0:
+        return 'id3'
+
+    return EXTENSION_FORMATS.get(ext)
+
+
+
+def load_audio(file_handle, audio_format: str):
+    # Mutagen modules are imported only for the formats actually seen
+    module, name    = AUDIO_FORMATS[audio_format]
+    audio_class     = getattr(importlib.import_module(module), name)
+
+    file_handle.seek(0)
+
+    return audio_class(file_handle)
+
+
+
+def read_tag(audio, audio_format: str, tag_name: str) -> str:
+    key = TAG_KEYS.get(audio_format, {}).get(tag_name, tag_name)
+
+    # WAV tags are ID3 frames
+    if audio_format == 'wav':
+        frame = audio.tags.get(key) if audio.tags is not None else None
+        return str(frame.text[0]) if frame and frame.text else None
+
+    values = audio.get(key)
+
+    return str(values[0]) if values else None
+
+
+
+def write_tag(audio, audio_format: str, tag_name: str, value: str) -> None:
+    key = TAG_KEYS.get(audio_format, {}).get(tag_name, tag_name)
+
+    # WAV tags are ID3 frames
+    if audio_format == 'wav':
+        from mutagen.id3 import Frames
+
+        if audio.tags is None:
+            audio.add_tags()
+
+        audio.tags.add(Frames[key](encoding=3, text=[value]))
+        return
+
+    audio[key] = [value]
+
+
+
+class TagCache(PathIndex):
+    """Tags already read, keyed by path, size and mtime: unchanged files are answered without being opened"""
+
+    TABLE   = 'tags'
+    SCHEMA  = """
+        CREATE TABLE IF NOT EXISTS tags (
+            path    TEXT PRIMARY KEY,
+            size    INTEGER NOT NULL,
+            mtime   INTEGER NOT NULL,
+            artist  TEXT,
+            album   TEXT,
+            genre   TEXT
+        );
+    """
+
+    def __init__(self, name: str = 'tag_cache.db'):
+        super().__init__(name)
+
+    def get(self, file_path: str, stat: os.stat_result) -> dict:
+        record = self.lookup(file_path)
+
+        if record is None or record[0] != stat.st_size or record[1] != stat.st_mtime_ns:
+            return None
+
+        return {'artist': record[2], 'album': record[3], 'genre': record[4]}
+
+    def set(self, file_path: str, stat: os.stat_result, tags: dict) -> None:
+        self.update(file_path, (stat.st_size, stat.st_mtime_ns, tags['artist'], tags['album'], tags['genre']))
+
+
+
+def reserve_padding(info) -> int:
+    # Tags still fitting in the current padding are written in place (no rewrite of the audio payload)
+    if info.padding >= 0:
+        return info.padding
+
+    return TAG_PADDING
+
+
+
+def get_audio_tags(file_path: str, cache: TagCache = None, messages: list = None) -> dict:
+    # Same reporting as set_audio_tags: collected when a list is given, printed otherwise
+    report = print if messages is None else messages.append
+
     tags = {
         'artist': None,
         'album': None,
@@ -29,97 +192,103 @@ def get_audio_tags(file_path: str) -> dict:
 
     try:
         ext = os.path.splitext(file_path)[1].lower()
-        audio = None
-
-        if ext == '.mp3':
-            audio = EasyID3(file_path)
-        elif ext == '.flac':
-            audio = FLAC(file_path)
-        elif ext in ['.m4a', '.mp4']:
-            audio = MP4(file_path)
-            # MP4 uses different tag names
-            tags['artist'] = audio.get('\xa9ART', [None])[0]
-            tags['album'] = audio.get('\xa9alb', [None])[0]
-            tags['genre'] = audio.get('\xa9gen', [None])[0]
-            return tags
-        elif ext == '.ogg':
-            audio = OggVorbis(file_path)
-        elif ext == '.wav':
-            audio = WAVE(file_path)
-
-        if audio:
-            tags['artist'] = audio.get('artist', [None])[0]
-            tags['album'] = audio.get('album', [None])[0]
-            tags['genre'] = audio.get('genre', [None])[0]
+
+        # Unchanged file (same size and mtime): one stat, the file is not opened
+        if cache is not None:
+            stat        = os.stat(file_path)
+            tags_cached = cache.get(file_path, stat)
+
+            if tags_cached is not None:
+                return tags_cached
+
+        with open(file_path, 'rb') as file_handle:
+            audio_format = sniff_audio_format(file_handle, ext)
+
+            if audio_format is None:
+                return tags
+
+            if audio_format == 'id3':
+                from mutagen.id3 import ID3NoHeaderError
+
+                try:
+                    audio = load_audio(file_handle, audio_format)
+                except ID3NoHeaderError:
+                    # No ID3 header yet: the file has no tags (not an error)
+                    audio = {}
+            else:
+                audio = load_audio(file_handle, audio_format)
+
+        for tag_name in tags:
+            tags[tag_name] = read_tag(audio, audio_format, tag_name)
+
+        if cache is not None:
+            cache.set(file_path, stat, tags)
 
     except Exception as e:
-        print(f"⚠️ Could not read tags from {os.path.basename(file_path)}: {e}")
+        report(f"⚠️ Could not read tags from {os.path.basename(file_path)}: {e}")
 
     return tags
 
 
 
-def set_audio_tags(file_path: str, artist: str = None, album: str = None, genre: str = None) -> bool:
+def set_audio_tags(file_path: str, artist: str = None, album: str = None, genre: str = None, cache: TagCache = None, messages: list = None) -> bool:
+    # Parallel callers pass a list and print it with the file (workers must not print), messages are printed otherwise
+    report = print if messages is None else messages.append
+
     try:
-        ext     = os.path.splitext(file_path)[1].lower()
-        audio   = None
-
-        if ext == '.mp3':
-            try:
-                audio = EasyID3(file_path)
-            except ID3NoHeaderError:
-                # Add ID3 header first
-                audio_file = ID3()
-                audio_file.save(file_path)
-                print(f"      → ID3 header saved, loading EasyID3...")
-                # Then load with EasyID3
-                audio = EasyID3(file_path)
-                print(f"      ✓ New ID3 tags created, audio type: {type(audio)}, audio is None: {audio is None}")
-            except Exception as mp3_err:
-                print(f"      ⚠️ MP3 error: {type(mp3_err).__name__}: {mp3_err}")
-                import traceback
-                traceback.print_exc()
+        ext = os.path.splitext(file_path)[1].lower()
+
+        # One handle for reading and writing the tags
+        with open(file_path, 'rb+') as file_handle:
+            audio_format = sniff_audio_format(file_handle, ext)
+
+            if audio_format is None:
+                report(f"   ⚠️ Unsupported audio format for {os.path.basename(file_path)}, ext={ext}")
                 return False
 
-        elif ext == '.flac':
-            audio = FLAC(file_path)
-        elif ext in ['.m4a', '.mp4']:
-            audio = MP4(file_path)
-            # MP4 uses different tag names
-            if artist:
-                audio['\xa9ART'] = [artist]
-            if album:
-                audio['\xa9alb'] = [album]
-            if genre:
-                audio['\xa9gen'] = [genre]
-            audio.save()
-            return True
-        elif ext == '.ogg':
-            audio = OggVorbis(file_path)
-        elif ext == '.wav':
-            audio = WAVE(file_path)
-
-        if audio is not None:
-            if artist:
-                audio['artist'] = artist
-            if album:
-                audio['album'] = album
-            if genre:
-                audio['genre'] = genre
-            audio.save()
-            return True
-        else:
-            print(f"   ⚠️ Audio object is None for {os.path.basename(file_path)}, ext={ext}")
-            return False
+            if audio_format == 'id3':
+                from mutagen.easyid3 import EasyID3
+                from mutagen.id3 import ID3NoHeaderError
+
+                try:
+                    audio = load_audio(file_handle, audio_format)
+                except ID3NoHeaderError:
+                    # New tags are built in memory, the header is written with them (one write)
+                    audio = EasyID3()
+                    report(f"      ✓ New ID3 tags created")
+                except Exception as mp3_err:
+                    report(f"      ⚠️ MP3 error: {type(mp3_err).__name__}: {mp3_err}")
+                    import traceback
+                    report(traceback.format_exc().rstrip())
+                    return False
+            else:
+                audio = load_audio(file_handle, audio_format)
+
+            # Only the values actually changing are written, nothing changes: no write at all
+            changes = [
+                (tag_name, value) for tag_name, value in [('artist', artist), ('album', album), ('genre', genre)]
+                if value and read_tag(audio, audio_format, tag_name) != value
+            ]
+
+            for tag_name, value in changes:
+                write_tag(audio, audio_format, tag_name, value)
+
+            if changes:
+                file_handle.seek(0)
+                audio.save(file_handle, padding=reserve_padding)
+
+        # The cache follows the write (new size and mtime)
+        if cache is not None:
+            cache.set(file_path, os.stat(file_path), {tag_name: read_tag(audio, audio_format, tag_name) for tag_name in ['artist', 'album', 'genre']})
+
+        return True
 
     except Exception as e:
-        print(f"❌ Error updating tags for {os.path.basename(file_path)}: {type(e).__name__}: {e}")
+        report(f"❌ Error updating tags for {os.path.basename(file_path)}: {type(e).__name__}: {e}")
         import traceback
-        traceback.print_exc()
+        report(traceback.format_exc().rstrip())
         return False
 
-    return False
-
 
 
 def find_most_common_tag(files_tags: list, tag_name: str) -> str:
@@ -156,7 +325,7 @@ def normalize_genre(genre: str) -> str:
 
 
 
-def process_audio_tags(target_path: str) -> None:
+def process_audio_tags(target_path: str, jobs: int = TAG_JOBS, cache: TagCache = None) -> None:
     if not os.path.exists(target_path):
         print(f"❌ Path does not exist: {target_path}")
         return
@@ -187,14 +356,19 @@ def process_audio_tags(target_path: str) -> None:
 
     print(f"📁 Found {len(audio_files)} audio file(s)")
 
-    # Extract tags from all files
-    files_tags = []
-    files_to_process = []
+    # Extract tags from all files (in parallel, results and warnings in the order of the files)
+    messages = [[] for _ in audio_files]
 
-    for file_path in audio_files:
-        tags = get_audio_tags(file_path)
-        files_tags.append(tags)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        files_tags = list(executor.map(lambda file_path, file_messages: get_audio_tags(file_path, cache, file_messages), audio_files, messages))
 
+    for file_messages in messages:
+        for message in file_messages:
+            print(message)
+
+    files_to_process = []
+
+    for file_path, tags in zip(audio_files, files_tags):
         # Check if file already has all tags
         has_all_tags = tags['artist'] and tags['album'] and tags['genre']
 
@@ -257,23 +431,196 @@ def process_audio_tags(target_path: str) -> None:
     print(f"   Genre: {genre_normalized}")
     print()
 
-    # Update files that need processing
-    for file_path in files_to_process:
+    # Update files that need processing (in parallel, reported in the order of the files)
+    def update_file(file_path: str) -> tuple:
+        messages = []
+        return set_audio_tags(file_path, artist_normalized, album_normalized, genre_normalized, cache, messages), messages
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(update_file, files_to_process))
+
+    for file_path, (success, messages) in zip(files_to_process, results):
         filename = os.path.basename(file_path)
-        success = set_audio_tags(file_path, artist_normalized, album_normalized, genre_normalized)
 
         if success:
             print(f"✅ Updated: {filename}")
         else:
             print(f"❌ Failed: {filename}")
 
+        for message in messages:
+            print(message)
+
+
+
+def find_audio_directories(target_path: str) -> list:
+    """Every directory of the tree holding audio files: (directory, audio files)"""
+    directories = []
+
+    for directory, _, files in walk_library(target_path):
+        audio_files = [
+            os.path.join(directory, item) for item in sorted(files)
+            if os.path.splitext(item)[1].lower() in AUDIO_EXTENSIONS
+        ]
+
+        if audio_files:
+            directories.append((directory, audio_files))
+
+    return directories
+
+
+
+def infer_directory_tags(directory: str, target_path: str, files_tags: list, answer: dict) -> dict:
+    """Tags of a directory: answers file first, then the most common tags, then the directory names"""
+    tags = {tag_name: answer.get(tag_name) or find_most_common_tag(files_tags, tag_name) for tag_name in ['artist', 'album', 'genre']}
+
+    # Directory names: <Artist>/<Album> or <Artist> - <Album> (never above the target directory)
+    depth = 0 if directory == target_path else os.path.relpath(directory, target_path).count(os.sep) + 1
+    name  = os.path.basename(directory)
+
+    if depth >= 1 and ' - ' in name:
+        artist, album   = name.split(' - ', 1)
+        tags['artist']  = tags['artist'] or artist
+        tags['album']   = tags['album'] or album
+
+    if depth >= 1:
+        tags['album'] = tags['album'] or name
+
+    if depth >= 2:
+        tags['artist'] = tags['artist'] or os.path.basename(os.path.dirname(directory))
+
+    return tags
+
+
+
+def tag_directory_batch(directory: str, audio_files: list, target_path: str, answer: dict, executor: ThreadPoolExecutor, cache: TagCache = None) -> tuple:
+    """Tag the files of one directory without prompts, return (output lines, tags left to answer or None)"""
+    lines       = [f"📁 {directory}: {len(audio_files)} audio file(s)"]
+    messages    = [[] for _ in audio_files]
+    files_tags  = list(executor.map(lambda file_path, file_messages: get_audio_tags(file_path, cache, file_messages), audio_files, messages))
+
+    for file_messages in messages:
+        lines.extend(f"   {message}" for message in file_messages)
+
+    files_to_process = [
+        file_path for file_path, tags in zip(audio_files, files_tags)
+        if not (tags['artist'] and tags['album'] and tags['genre'])
+    ]
+
+    if not files_to_process:
+        lines.append("   ⏭️  Already tagged - Skipping")
+        return lines, None
+
+    tags = infer_directory_tags(directory, target_path, files_tags, answer)
+
+    # Normalize tags
+    artist_normalized   = convert_name(tags['artist']) if tags['artist'] else None
+    album_normalized    = convert_name(tags['album']) if tags['album'] else None
+    genre_normalized    = normalize_genre(tags['genre'])
+
+    lines.append(f"   📋 Artist: {artist_normalized}, Album: {album_normalized}, Genre: {genre_normalized}")
+
+    # Known values are applied now, the missing ones wait for the answers file
+    def update_file(file_path: str) -> tuple:
+        messages = []
+        return set_audio_tags(file_path, artist_normalized, album_normalized, genre_normalized, cache, messages), messages
+
+    results = list(executor.map(update_file, files_to_process))
+
+    for file_path, (success, messages) in zip(files_to_process, results):
+        lines.append(f"   {'✅ Updated' if success else '❌ Failed'}: {os.path.basename(file_path)}")
+        lines.extend(messages)
+
+    unanswered = {'artist': artist_normalized, 'album': album_normalized, 'genre': genre_normalized}
+
+    if all(unanswered.values()):
+        return lines, None
+
+    # An invalid genre is left to answer as well
+    if tags['genre'] and not genre_normalized:
+        lines.append(f"   ⚠️ Invalid genre '{tags['genre']}'. Valid genres: {', '.join(VALID_GENRES)}")
+
+    lines.append(f"   ❓ Missing: {', '.join(name for name, value in unanswered.items() if not value)}")
+
+    return lines, unanswered
+
+
+
+def process_audio_tags_batch(target_path: str, answers_path: str = ANSWERS_FILE, jobs: int = TAG_JOBS, directory_jobs: int = 1, cache: TagCache = None) -> int:
+    """Tag the whole tree without prompts, return the number of directories left in the answers file"""
+    if not os.path.isdir(target_path):
+        print(f"❌ Path is not a directory: {target_path}")
+        return 0
+
+    # Answers are keyed by directory, relative to the target directory
+    answers = {}
+
+    if os.path.exists(answers_path):
+        with open(answers_path, encoding='utf-8') as file:
+            answers = json.load(file)
+
+        print(f"📄 Using answers from: {answers_path}")
+
+    directories = find_audio_directories(target_path)
+    print(f"📁 Found {len(directories)} director{'y' if len(directories) == 1 else 'ies'} with audio files")
+
+    unanswered = {}
+
+    # Directories run on their own pool, files of every directory share the file pool
+    with ThreadPoolExecutor(max_workers=jobs) as executor, ThreadPoolExecutor(max_workers=directory_jobs) as directory_executor:
+        def tag_directory(item: tuple) -> tuple:
+            directory, audio_files = item
+            key = os.path.relpath(directory, target_path)
+
+            return key, tag_directory_batch(directory, audio_files, target_path, answers.get(key, {}), executor, cache)
+
+        # Output of one directory is printed as one block, in the order of the tree
+        for key, (lines, tags) in directory_executor.map(tag_directory, directories):
+            print('\n'.join(lines))
+
+            if tags:
+                unanswered[key] = tags
+
+    if not unanswered:
+        return 0
+
+    # Known values are written too, as a reminder: only the empty ones need an answer
+    for key, tags in unanswered.items():
+        answer = answers.setdefault(key, {})
+
+        for tag_name, value in tags.items():
+            answer[tag_name] = answer.get(tag_name) or value
+
+    with open(answers_path, 'w', encoding='utf-8') as file:
+        json.dump(answers, file, indent=4, ensure_ascii=False, sort_keys=True)
+
+    print(f"\n📝 {len(unanswered)} director{'y needs' if len(unanswered) == 1 else 'ies need'} answers, fill in {answers_path} and run again")
+    print(f"🎵 Valid genres: {', '.join(VALID_GENRES)}")
+
+    return len(unanswered)
+
 
 
 ###MAIN###
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Update and standardize the audio tags of a directory")
+    parser.add_argument('path', nargs='?', help="Target directory (asked when missing)")
+    parser.add_argument('-j', '--jobs', type=int, default=TAG_JOBS, help=f"Number of files read or written in parallel (default: {TAG_JOBS})")
+    parser.add_argument('--no-cache', action='store_true', help="Read the tags of every file, even the ones unchanged since the last run")
+    parser.add_argument('--batch', action='store_true', help="Tag the whole tree without prompts (tags inferred per directory)")
+    parser.add_argument('--answers', default=ANSWERS_FILE, help=f"Batch mode: file of the values to answer (default: {ANSWERS_FILE})")
+    parser.add_argument('--directory-jobs', type=int, default=1, help="Batch mode: number of directories processed in parallel (default: 1)")
+    arguments = parser.parse_args()
+
+    for name in ['jobs', 'directory_jobs']:
+        if getattr(arguments, name) < 1:
+            parser.error(f"--{name.replace('_', '-')} must be at least 1")
+
+    if arguments.batch and not arguments.path:
+        parser.error("--batch needs a path (no prompts)")
+
     # Check if path provided as command line argument
-    if len(sys.argv) > 1:
-        target_path = sys.argv[1]
+    if arguments.path:
+        target_path = arguments.path
         print(f"📂 Using path from argument: {target_path}")
     else:
         target_path = input("Enter target directory path: ")
@@ -284,7 +631,25 @@ if __name__ == "__main__":
     # Convert to absolute path
     target_path = os.path.abspath(target_path)
 
+    # Tags of unchanged files (same size and mtime) come from the cache
+    cache = None if arguments.no_cache else TagCache()
+
     # Process audio tags
-    process_audio_tags(target_path)
+    completed = False
+
+    try:
+        if arguments.batch:
+            unanswered = process_audio_tags_batch(target_path, arguments.answers, arguments.jobs, arguments.directory_jobs, cache)
+        else:
+            unanswered = 0
+            process_audio_tags(target_path, arguments.jobs, cache)
+
+        completed = True
+    finally:
+        # Batch mode reads the whole tree, the interactive mode only the files of the target directory
+        if cache:
+            cache.save(target_path if completed else None, recursive=arguments.batch)
+            cache.close()
 
     print("✨ All done!")
+    sys.exit(1 if unanswered else 0)